@@ -1,15 +1,81 @@
-from django.contrib import admin
-from .models import Post, Comment
+import os
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from .importer import FORMATS, detect_format, import_file
+from .models import Post, Comment, ImportJob, Task
+from .search import matching_post_ids
+from .tasks import enqueue
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label="Файл NDJSON или CSV")
+    format = forms.ChoiceField(
+        label="Формат", required=False,
+        choices=[('', "По расширению")] + [(fmt, fmt) for fmt in FORMATS],
+    )
+    create_authors = forms.BooleanField(label="Создавать отсутствующих авторов", required=False)
+
+
+def _enqueue_import(request, job):
+    enqueue(import_file, job_id=job.pk)
+    messages.success(request, f"Импорт #{job.pk} поставлен в очередь, ход виден в списке импортов")
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at', 'is_published')
+    list_display = ('title', 'author', 'created_at', 'is_published', 'comment_count')
     list_filter = ('is_published', 'created_at', 'author')
     search_fields = ('title', 'content')
     list_editable = ('is_published',)
     date_hierarchy = 'created_at'
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='blog_post_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Загрузка файла и постановка импорта в очередь; файл сохраняется, чтобы импорт можно было продолжить"""
+        if not self.has_add_permission(request):
+            return redirect('admin:blog_post_changelist')
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            os.makedirs(settings.BLOG_IMPORT_DIR, exist_ok=True)
+            target = os.path.join(settings.BLOG_IMPORT_DIR, f'{uuid.uuid4().hex}-{os.path.basename(upload.name)}')
+            with open(target, 'wb') as fh:
+                for chunk in upload.chunks():
+                    fh.write(chunk)
+            job = ImportJob.objects.create(
+                source=target,
+                format=form.cleaned_data['format'] or detect_format(upload.name),
+                create_authors=form.cleaned_data['create_authors'],
+            )
+            _enqueue_import(request, job)
+            return redirect('admin:blog_importjob_changelist')
+        return TemplateResponse(request, 'admin/blog/post/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': "Импорт статей",
+        })
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо ILIKE '%...%'"""
+        if search_term:
+            ids = matching_post_ids(search_term)
+            if ids is not None:
+                return queryset.filter(pk__in=ids), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -17,3 +83,50 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'author')
     search_fields = ('content', 'post__title')
     date_hierarchy = 'created_at'
+    # Выпадающий список всех комментариев не нужен и дорог
+    raw_id_fields = ('parent',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # Путь и уровень считаются при создании: перенос в другую ветку или статью
+        # оставил бы комментарий и его ответы со старым путём (и счётчики - неверными)
+        if obj is not None:
+            return (*super().get_readonly_fields(request, obj), 'post', 'parent')
+        return super().get_readonly_fields(request, obj)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'source', 'format', 'status', 'rows_done', 'posts_created',
+        'comments_created', 'rows_rejected', 'updated_at',
+    )
+    list_filter = ('status', 'format')
+    readonly_fields = [field.name for field in ImportJob._meta.fields]
+    actions = ['resume_import']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Продолжить импорт с места остановки")
+    def resume_import(self, request, queryset):
+        # Уже выполняемый импорт задача не тронет (см. importer.claim)
+        for job in queryset.exclude(status=ImportJob.DONE):
+            _enqueue_import(request, job)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = [field.name for field in Task._meta.fields]
+    actions = ['retry_tasks']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Повторить выбранные задачи")
+    def retry_tasks(self, request, queryset):
+        count = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now(), last_error=''
+        )
+        messages.success(request, f"Задач поставлено в очередь: {count}")
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Пересоздание таблиц в миграциях SQLite удаляет триггеры FTS5
+    from .search import ensure_search_triggers
+
+    ensure_search_triggers(connections[using])
 
 
 class BlogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "blog"
+
+    def ready(self):
+        from . import db, hooks, importer, signals  # noqa: F401
+
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,351 @@
+"""
+Нагрузочные замеры эндпоинтов блога.
+
+Данные создаются пачками через bulk_create, затем каждый сценарий (CASES)
+прогоняется через тестовый клиент Django: RPS, задержки p50/p95/p99,
+число SQL-запросов и пик выделенной памяти на запрос. Дополнительно
+GET-сценарии можно прогнать через настоящий WSGI-сервер в потоке
+(wsgiref) параллельными клиентами, а сценарии с входом - повторить
+под разными хранилищами сессий. Результаты - список словарей,
+который команда bench_blog сохраняет в JSON для сравнения прогонов.
+"""
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.paginator import Paginator
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.template.backends.django import DjangoTemplates
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, Post
+
+
+WORDS = (
+    'django python запрос кэш индекс шаблон сервер база данных статья '
+    'комментарий пагинация курсор воркер пул соединение нагрузка'
+).split()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """RPS и задержки (мс) по списку длительностей запросов в секундах"""
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+    }
+
+
+def fetch(url, timeout=30):
+    """(длительность, успех) одного GET-запроса по HTTP"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+# Фабрики данных
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def create_users(count, prefix='bench'):
+    # Хэш пароля считается один раз: PBKDF2 на каждого пользователя слишком дорог
+    password = make_password('bench-password')
+    return User.objects.bulk_create(
+        [User(username=f'{prefix}{i}', password=password) for i in range(count)],
+        batch_size=1000,
+    )
+
+
+def create_posts(authors, count, rng, published_ratio=0.9):
+    now = timezone.now()
+    return Post.objects.bulk_create(
+        [
+            Post(
+                title=_text(rng, 6).capitalize(),
+                content=_text(rng, rng.randint(50, 400)),
+                author=rng.choice(authors),
+                created_at=now - timedelta(minutes=i),
+                is_published=rng.random() < published_ratio,
+            )
+            for i in range(count)
+        ],
+        batch_size=1000,
+    )
+
+
+def create_comments(posts, authors, count, rng):
+    # Первые статьи получают заметно больше комментариев
+    weights = [1 / (rank + 1) for rank in range(len(posts))]
+    now = timezone.now()
+    return Comment.objects.bulk_create(
+        [
+            Comment(
+                post=post,
+                author=rng.choice(authors),
+                content=_text(rng, rng.randint(5, 60)),
+                created_at=now - timedelta(seconds=i),
+            )
+            for i, post in enumerate(rng.choices(posts, weights, k=count))
+        ],
+        batch_size=1000,
+    )
+
+
+def seed(users=20, posts=200, comments=2000, random_seed=42):
+    """Заполняет БД и возвращает (пользователь для запросов, опубликованная статья)"""
+    rng = random.Random(random_seed)
+    authors = create_users(users)
+    post_objs = create_posts(authors, posts, rng)
+    published = [post for post in post_objs if post.is_published] or post_objs
+    create_comments(published, authors, comments, rng)
+    # bulk_create в SQLite не всегда возвращает id - перечитываем
+    hot_post = Post.objects.filter(is_published=True).order_by('-comment_count').first()
+    return User.objects.get(username=authors[0].username), hot_post
+
+
+# Сценарии
+
+class Case:
+    def __init__(self, name, url, method='get', data=None, login=False, http=True):
+        self.name = name
+        self.url = url          # (post) -> путь
+        self.method = method
+        self.data = data
+        self.login = login
+        self.http = http        # можно гонять через WSGI-сервер без сессии и CSRF
+
+
+CASES = [
+    Case('home', lambda post: reverse('home')),
+    Case('post_list', lambda post: reverse('post_list')),
+    Case('post_list_page_5', lambda post: reverse('post_list') + '?page=5'),
+    Case('post_detail', lambda post: reverse('post_detail', args=[post.pk])),
+    Case('api_posts', lambda post: reverse('api_posts')),
+    Case('my_posts', lambda post: reverse('my_posts'), login=True, http=False),
+    Case(
+        'comment_post',
+        lambda post: reverse('post_detail', args=[post.pk]),
+        method='post',
+        data={'content': 'Комментарий из нагрузочного теста'},
+        login=True,
+        http=False,
+    ),
+]
+
+
+def _request(client, case, path):
+    response = getattr(client, case.method)(path, case.data)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{case.name}: {path} ответил {response.status_code}')
+    return response
+
+
+def profile_request(client, case, path):
+    """SQL-запросы и пик памяти (КиБ) одного запроса"""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _request(client, case, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'queries': len(queries), 'peak_kib': round(peak / 1024, 1)}
+
+
+def run_case(case, post, user, iterations=100, warmup=5):
+    """Прогон сценария через тестовый клиент (последовательно)"""
+    client = Client()
+    if case.login:
+        client.force_login(user)
+    path = case.url(post)
+    for _ in range(warmup):
+        _request(client, case, path)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        _request(client, case, path)
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    result = {'case': case.name, 'driver': 'client', 'path': path, 'concurrency': 1}
+    result.update(summarize(latencies, elapsed))
+    # Замеры с инструментированием - отдельным запросом, чтобы не искажать задержки
+    result.update(profile_request(client, case, path))
+    return result
+
+
+def run_session_modes(cases, post, user, modes, iterations=100):
+    """Сценарии с входом под каждым режимом хранения сессий (BLOG_SESSION_MODE)"""
+    results = []
+    for mode in modes:
+        # Тестовый клиент создаётся внутри run_case и подхватывает SESSION_ENGINE
+        with override_settings(SESSION_ENGINE=settings.BLOG_SESSION_ENGINES[mode]):
+            for case in cases:
+                if case.login:
+                    result = run_case(case, post, user, iterations)
+                    result['session'] = mode
+                    results.append(result)
+    return results
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _WSGIHandler(WSGIHandler):
+    def __call__(self, environ, start_response):
+        try:
+            return super().__call__(environ, start_response)
+        finally:
+            # Потоки сервера не должны держать соединения с БД
+            connections.close_all()
+
+
+class LiveWSGIServer:
+    """WSGI-приложение Django в фоновом потоке на свободном порту"""
+
+    def __enter__(self):
+        self.httpd = make_server(
+            '127.0.0.1', 0, _WSGIHandler(),
+            server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_case_http(base_url, case, post, requests=200, concurrency=10, timeout=30):
+    """Прогон GET-сценария параллельными HTTP-клиентами"""
+    path = case.url(post)
+    url = base_url + path
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda _: fetch(url, timeout), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    result = {'case': case.name, 'driver': 'wsgi', 'path': path, 'concurrency': concurrency}
+    result.update(summarize([latency for latency, _ in samples], elapsed))
+    result['errors'] = sum(1 for _, ok in samples if not ok)
+    return result
+
+
+# Рендер шаблонов
+
+APP_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+TEMPLATE_LOADER_VARIANTS = {
+    # Разбор шаблона и родителя на каждый рендер
+    'uncached': APP_LOADERS,
+    # Стандартный кэширующий загрузчик Django
+    'cached': [('django.template.loaders.cached.Loader', APP_LOADERS)],
+    # blog.template_loaders.Loader, шаблоны скомпилированы заранее
+    'precompiled': [('blog.template_loaders.Loader', APP_LOADERS)],
+}
+
+
+def _template_backend(loaders):
+    return DjangoTemplates({
+        'NAME': 'bench',
+        'DIRS': [],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'loaders': loaders,
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    })
+
+
+def _post_list_context(cards):
+    rng = random.Random(cards)
+    author = User(pk=1, username='bench')
+    posts = []
+    for pk in range(1, cards + 1):
+        post = Post(
+            pk=pk, title=_text(rng, 6).capitalize(), author=author,
+            created_at=timezone.now(), comment_count=rng.randint(0, 50), is_published=True,
+        )
+        post.excerpt = _text(rng, 80)
+        posts.append(post)
+    page_obj = Paginator(posts * 3, cards).page(1)
+    return {'posts': page_obj.object_list, 'page_obj': page_obj}
+
+
+def run_template_benchmark(cards=50, iterations=300, template_name='blog/post_list.html'):
+    """
+    Время рендера post_list с cards карточками для каждого варианта загрузчиков.
+
+    Кэш фрагментов подменяется DummyCache, чтобы каждый рендер честно
+    проходил все карточки.
+    """
+    request = RequestFactory().get('/posts/')
+    request.user = AnonymousUser()
+    context = _post_list_context(cards)
+    results = []
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+        for variant, loaders in TEMPLATE_LOADER_VARIANTS.items():
+            backend = _template_backend(loaders)
+            backend.get_template(template_name).render(context, request)  # прогрев
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(iterations):
+                request_started = time.perf_counter()
+                backend.get_template(template_name).render(context, request)
+                latencies.append(time.perf_counter() - request_started)
+            result = {'variant': variant, 'template': template_name, 'cards': cards}
+            result.update(summarize(latencies, time.perf_counter() - started))
+            results.append(result)
+    baseline = results[0]['mean_ms']
+    for result in results:
+        result['saving_pct'] = round(100 * (1 - result['mean_ms'] / baseline), 1)
+    return results
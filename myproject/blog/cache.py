@@ -0,0 +1,189 @@
+"""
+Кэширование отрендеренного HTML.
+
+Фрагменты шаблонов (тело статьи, карточка, комментарии) и целые страницы
+для анонимных посетителей хранятся под ключами, содержащими версию области:
+статьи (``post:<id>``) или публичных списков (``lists``). Версия хранится
+в кэше и меняется сигналами, поэтому устаревшие записи просто перестают
+читаться и вытесняются по таймауту. Пока реплики могут отставать от смены
+версии, страница для кэша собирается по основной БД, а фрагмент, собранный
+по реплике, не сохраняется.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+
+from .metrics import record_cache
+from .routers import pin_primary, read_from_replica
+
+
+LISTS_SCOPE = 'lists'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def get_version(scope):
+    """Текущая версия области кэша"""
+    key = f'blog:version:{scope}'
+    version = cache.get(key)
+    if version is None:
+        # Версия на основе времени не повторяет старые значения,
+        # даже если ключ версии был вытеснен из кэша.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope):
+    """Асинхронный вариант get_version"""
+    key = f'blog:version:{scope}'
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(scope):
+    """
+    Меняет версию области сразу и ещё раз после коммита текущей транзакции:
+    до коммита параллельный запрос видит старые данные и может сохранить их
+    под промежуточной версией - повторная смена делает их недоступными.
+    """
+    key = f'blog:version:{scope}'
+    cache.set(key, time.time_ns(), None)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def invalidate_post(post_id):
+    """Сбрасывает фрагменты и анонимную страницу статьи"""
+    bump_version(post_scope(post_id))
+
+
+def invalidate_lists():
+    """Сбрасывает анонимные страницы главной и списка статей"""
+    bump_version(LISTS_SCOPE)
+
+
+def invalidate_comment_counts(post_ids):
+    """Число комментариев выводится на странице статьи и в карточках списков"""
+    for post_id in post_ids:
+        invalidate_post(post_id)
+    invalidate_lists()
+
+
+def _recently_bumped(version):
+    # Версия - время её смены в нс. Реплика могла ещё не получить эту запись,
+    # пока не прошло BLOG_REPLICA_STICKY_SECONDS (то же допущение, что у cookie)
+    return time.time_ns() - version < settings.BLOG_REPLICA_STICKY_SECONDS * 1_000_000_000
+
+
+def _record(kind, hit):
+    with _stats_lock:
+        _stats[f'{kind}_hits' if hit else f'{kind}_misses'] += 1
+    record_cache(kind, hit)
+
+
+def get_or_render(name, post_id, render):
+    """Возвращает фрагмент из кэша или рендерит и сохраняет его"""
+    version = get_version(post_scope(post_id))
+    key = f'blog:fragment:{name}:{post_id}:{version}'
+    content = cache.get(key)
+    _record('fragment', content is not None)
+    if content is None:
+        content = render()
+        # Данные реплики, отстающей от недавней записи, под новой версией не сохраняем
+        if not (read_from_replica() and _recently_bumped(version)):
+            cache.set(key, content, settings.BLOG_FRAGMENT_CACHE_TIMEOUT)
+    return content
+
+
+def fragment_stats():
+    """Счётчики попаданий и промахов кэша фрагментов в этом процессе"""
+    with _stats_lock:
+        return {'hits': _stats['fragment_hits'], 'misses': _stats['fragment_misses']}
+
+
+def page_stats():
+    """Счётчики попаданий и промахов страничного кэша в этом процессе"""
+    with _stats_lock:
+        return {'hits': _stats['page_hits'], 'misses': _stats['page_misses']}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+async def _can_use_page_cache(request):
+    if not settings.BLOG_PAGE_CACHE or request.method not in ('GET', 'HEAD'):
+        return False
+    # Ожидающие показа сообщения должны попасть в страницу
+    if CookieStorage.cookie_name in request.COOKIES:
+        return False
+    user = await request.auser()
+    return not user.is_authenticated
+
+
+def _is_cacheable_response(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # Cookie сессии и CSRF ставятся middleware уже после view
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    session = getattr(request, 'session', None)
+    if session is not None and session.modified:
+        return False
+    # Страница показала сообщения из хранилища - они не для всех
+    return not getattr(getattr(request, '_messages', None), 'used', False)
+
+
+def anonymous_page_cache(scope):
+    """
+    Кэширует страницу асинхронного view целиком для анонимных GET-запросов.
+
+    ``scope`` - функция (request, **view_kwargs) -> область кэша, по версии
+    которой страница сбрасывается. Ключ также зависит от URL и языка.
+    Ответы, ставящие cookie или несущие сообщения, не кэшируются;
+    авторизованные пользователи всегда получают свежую страницу.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not await _can_use_page_cache(request):
+                return await view(request, *args, **kwargs)
+
+            url_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            area = scope(request, **kwargs)
+            version = await aget_version(area)
+            key = f'blog:page:{area}:{version}:{translation.get_language()}:{url_hash}'
+            response = await cache.aget(key)
+            _record('page', response is not None)
+            if response is not None:
+                # Сохранённая страница несёт ETag view - отвечаем 304 по нему
+                return get_conditional_response(request, etag=response.get('ETag'), response=response)
+
+            if _recently_bumped(version):
+                # Страница попадёт в кэш под новой версией - данные нужны с записью
+                pin_primary()
+            response = await view(request, *args, **kwargs)
+            if _is_cacheable_response(request, response):
+                await cache.aset(key, response, settings.BLOG_PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
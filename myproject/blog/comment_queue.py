@@ -0,0 +1,103 @@
+"""
+Отложенная запись комментариев (BLOG_COMMENT_QUEUE=1).
+
+Под всплеском комментариев к одной статье каждая синхронная вставка
+обновляет одну и ту же строку Post.comment_count и сбрасывает кэш статьи.
+В режиме очереди post_detail после проверки формы только вставляет строку
+в таблицу PendingComment, а воркер process_comment_queue переносит
+комментарии пачками: одна транзакция, один UPDATE счётчика и один сброс
+кэша на статью за пачку. Автор видит свои ожидающие комментарии сразу.
+
+Очередь ограничена BLOG_COMMENT_QUEUE_MAX_DEPTH: при переполнении enqueue
+выбрасывает QueueFull, и view отвечает 503 с Retry-After.
+"""
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .cache import invalidate_comment_counts
+from .metrics import (
+    COMMENT_QUEUE_ENQUEUED, COMMENT_QUEUE_FLUSH_SECONDS, COMMENT_QUEUE_FLUSHED,
+    COMMENT_QUEUE_LAG_SECONDS, COMMENT_QUEUE_REJECTED,
+)
+from .models import Comment, PendingComment, Post, path_segment
+
+
+class QueueFull(Exception):
+    """Очередь комментариев переполнена"""
+
+
+def queue_depth(limit=None):
+    """Длина очереди; с limit считается не дальше limit строк"""
+    pending = PendingComment.objects.order_by()
+    if limit is not None:
+        pending = pending.values('pk')[:limit]
+    return pending.count()
+
+
+def enqueue(post, author, content, parent=None):
+    limit = settings.BLOG_COMMENT_QUEUE_MAX_DEPTH
+    if queue_depth(limit) >= limit:
+        COMMENT_QUEUE_REJECTED.inc()
+        raise QueueFull
+    pending = PendingComment.objects.create(post=post, author=author, parent=parent, content=content)
+    COMMENT_QUEUE_ENQUEUED.inc()
+    return pending
+
+
+aenqueue = sync_to_async(enqueue)
+
+
+def pending_comments(post, author):
+    """Ещё не записанные комментарии автора к статье"""
+    return PendingComment.objects.filter(post=post, author=author).order_by('pk')
+
+
+def flush(batch_size=500):
+    """
+    Переносит до batch_size комментариев из очереди в одной транзакции.
+
+    Несколько воркеров не мешают друг другу: строки очереди берутся
+    с SKIP LOCKED (в PostgreSQL). Возвращает число записанных комментариев.
+    """
+    started = time.perf_counter()
+    with transaction.atomic():
+        pending = list(
+            PendingComment.objects.select_for_update(skip_locked=True).order_by('pk')[:batch_size]
+        )
+        if not pending:
+            return 0
+        parents = Comment.objects.only('id', 'parent_id', 'path', 'depth').in_bulk(
+            {item.parent_id for item in pending if item.parent_id is not None}
+        )
+        comments = []
+        prefixes = []
+        for item in pending:
+            comment = Comment(post_id=item.post_id, author_id=item.author_id, content=item.content,
+                              created_at=item.created_at)
+            prefixes.append(comment.attach_to(parents[item.parent_id]) if item.parent_id else '')
+            comments.append(comment)
+        # Одна вставка на пачку вместе с ответами; сигналы не шлются, поэтому
+        # счётчики и кэш - ниже, по разу на статью. Путь заканчивается
+        # собственным id, и его дописывает один UPDATE после INSERT
+        insert = models.QuerySet(Comment)
+        insert.bulk_create(comments)
+        for comment, prefix in zip(comments, prefixes):
+            comment.path = prefix + path_segment(comment.pk)
+        insert.bulk_update(comments, ['path'])
+        counts = Counter(comment.post_id for comment in comments)
+        for post_id, delta in counts.items():
+            Post.adjust_comment_count(post_id, delta)
+        invalidate_comment_counts(counts)
+        PendingComment.objects.filter(pk__in=[item.pk for item in pending]).delete()
+
+    now = timezone.now()
+    COMMENT_QUEUE_FLUSH_SECONDS.observe(time.perf_counter() - started)
+    COMMENT_QUEUE_FLUSHED.inc(len(pending))
+    for item in pending:
+        COMMENT_QUEUE_LAG_SECONDS.observe((now - item.created_at).total_seconds())
+    return len(pending)
@@ -0,0 +1,107 @@
+"""
+Условные GET-запросы (ETag) для асинхронных view.
+
+ETag считается одним лёгким запросом к таблице статей через асинхронный ORM.
+Last-Modified не отдаётся: дата последней правки не сдвигается при удалении
+или снятии статьи с публикации и при удалении комментария, и клиент,
+присылающий только If-Modified-Since, получил бы ошибочный 304. Удаления
+видны в ETag через число статей и счётчики comment_count.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, quote_etag
+
+from .models import PendingComment, Post
+
+
+def _make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+async def post_detail_etag(request, pk):
+    """ETag страницы статьи или None"""
+    # Страница с сообщениями уникальна, её нельзя подтверждать ответом 304
+    if CookieStorage.cookie_name in request.COOKIES:
+        return None
+    validators = await (
+        Post.objects.filter(pk=pk, is_published=True)
+        .values('updated_at', 'comment_count')
+        .annotate(last_comment=Max('comments__created_at'))
+        .order_by('pk')
+        .afirst()
+    )
+    if validators is None:
+        return None
+    user = await request.auser()
+    last_comment = validators['last_comment']
+    # Свои комментарии из очереди автор видит до их записи
+    pending = 0
+    if settings.BLOG_COMMENT_QUEUE and user.is_authenticated:
+        pending = await PendingComment.objects.filter(post_id=pk, author=user).acount()
+    # Разметка зависит от пользователя (форма комментария, меню). Форма несёт
+    # CSRF-токен, который меняется при повторном входе: страница со старым
+    # токеном не должна подтверждаться ответом 304
+    return _make_etag(
+        user.pk or 'anon',
+        request.META.get('CSRF_COOKIE', '') if user.is_authenticated else '',
+        pending,
+        validators['updated_at'].isoformat(),
+        validators['comment_count'],
+        last_comment and last_comment.isoformat(),
+    )
+
+
+async def post_comments_etag(request, pk):
+    """ETag комментариев статьи в API или None"""
+    validators = await (
+        Post.objects.filter(pk=pk, is_published=True)
+        .values('comment_count')
+        .annotate(last_comment=Max('comments__created_at'))
+        .order_by('pk')
+        .afirst()
+    )
+    if validators is None:
+        return None
+    last_comment = validators['last_comment']
+    return _make_etag('comments', pk, validators['comment_count'], last_comment and last_comment.isoformat())
+
+
+async def api_posts_etag(request):
+    """ETag списка статей API"""
+    # comment_count денормализован, так что комментарии видны без JOIN
+    validators = await Post.objects.filter(is_published=True).aaggregate(
+        last_updated=Max('updated_at'),
+        total=Count('id'),
+        comments=Sum('comment_count'),
+    )
+    last_updated = validators['last_updated']
+    return _make_etag(
+        last_updated and last_updated.isoformat(),
+        validators['total'],
+        validators['comments'],
+    )
+
+
+def async_condition(etag_func):
+    """
+    Аналог django.views.decorators.http.condition(etag_func=...) для асинхронных view.
+
+    etag_func - корутина (request, *args, **kwargs) -> etag или None.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and etag:
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,45 @@
+"""
+Наблюдение за пулом соединений PostgreSQL (DB_POOL=1, psycopg_pool).
+
+pool_stats() отдаёт статистику пулов текущего процесса. Обработчик
+request_finished выставляет по ней метрики blog_db_pool_* (/metrics)
+и пишет предупреждение, когда запросы ждут свободное соединение -
+признак того, что DB_POOL_MAX_SIZE мал для нагрузки.
+"""
+import logging
+
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+
+from .metrics import DB_POOL_AVAILABLE, DB_POOL_SIZE, DB_POOL_WAITING
+
+
+logger = logging.getLogger(__name__)
+
+
+def pool_stats():
+    """Статистика psycopg_pool по алиасам БД, у которых включён пул"""
+    stats = {}
+    for alias in connections:
+        # У SQLite и PostgreSQL без OPTIONS["pool"] пула нет
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+@receiver(request_finished)
+def record_pool_stats(sender, **kwargs):
+    for alias, stats in pool_stats().items():
+        DB_POOL_SIZE.labels(alias).set(stats.get('pool_size', 0))
+        DB_POOL_AVAILABLE.labels(alias).set(stats.get('pool_available', 0))
+        DB_POOL_WAITING.labels(alias).set(stats.get('requests_waiting', 0))
+        if stats.get('requests_waiting') or stats.get('pool_available') == 0:
+            logger.warning(
+                "Пул соединений '%s' исчерпан: размер %s, свободно %s, ожидают %s",
+                alias,
+                stats.get('pool_size'),
+                stats.get('pool_available'),
+                stats.get('requests_waiting'),
+            )
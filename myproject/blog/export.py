@@ -0,0 +1,116 @@
+"""
+Потоковая выгрузка статей с вложенными комментариями.
+
+Статьи и комментарии читаются двумя курсорами (.iterator(chunk_size=...),
+в PostgreSQL - серверными) в порядке id статьи и сливаются на лету, как
+merge join. Каждая статья и каждый комментарий сериализуются по отдельности,
+поэтому память не зависит ни от числа статей, ни от числа комментариев
+у самой обсуждаемой статьи.
+"""
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+# Размер куска ответа: меньше системных вызовов, чем по строке на объект
+BUFFER_SIZE = 64 * 1024
+
+POST_FIELDS = (
+    'id', 'title', 'content', 'author__username', 'created_at', 'updated_at',
+    'is_published', 'comment_count',
+)
+COMMENT_FIELDS = ('id', 'post_id', 'parent_id', 'author__username', 'content', 'created_at')
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def _post_head(row):
+    """JSON статьи без закрывающих '"comments": [...]}'"""
+    post = {
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'author': row['author__username'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'is_published': row['is_published'],
+        'comment_count': row['comment_count'],
+    }
+    return _encoder.encode(post)[:-1] + ', "comments": ['
+
+
+def _comment(row):
+    return _encoder.encode({
+        'id': row['id'],
+        # id комментария, на который это ответ: import_blog восстанавливает по нему дерево
+        'parent': row['parent_id'],
+        'author': row['author__username'],
+        'content': row['content'],
+        'created_at': row['created_at'],
+    })
+
+
+def _pieces(fmt, published_only, chunk_size):
+    posts = Post.objects.values(*POST_FIELDS).order_by('id')
+    comments = Comment.objects.values(*COMMENT_FIELDS).order_by('post_id', 'created_at', 'id')
+    if published_only:
+        posts = posts.filter(is_published=True)
+        comments = comments.filter(post__is_published=True)
+    comments = comments.iterator(chunk_size=chunk_size)
+    comment = next(comments, None)
+
+    separator = '\n' if fmt == 'ndjson' else ',\n'
+    if fmt == 'json':
+        yield '[\n'
+    first = True
+    for post in posts.iterator(chunk_size=chunk_size):
+        # Комментарии статей, удалённых между открытием курсоров, пропускаются
+        while comment is not None and comment['post_id'] < post['id']:
+            comment = next(comments, None)
+        if not first and fmt == 'json':
+            yield separator
+        first = False
+        yield _post_head(post)
+        first_comment = True
+        while comment is not None and comment['post_id'] == post['id']:
+            yield _comment(comment) if first_comment else ', ' + _comment(comment)
+            first_comment = False
+            comment = next(comments, None)
+        yield ']}\n' if fmt == 'ndjson' else ']}'
+    if fmt == 'json':
+        yield '\n]\n'
+
+
+def export_chunks(fmt='ndjson', published_only=False, chunk_size=2000):
+    """Генератор кусков выгрузки (строк) размером около BUFFER_SIZE"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат {fmt!r}')
+    buffer = []
+    size = 0
+    for piece in _pieces(fmt, published_only, chunk_size):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def aiterate(iterator):
+    """
+    Отдаёт синхронный генератор асинхронно, по куску в потоке.
+
+    Под ASGI StreamingHttpResponse с синхронным итератором вычитывает его
+    целиком в память; здесь курсоры остаются в одном потоке (thread_sensitive).
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
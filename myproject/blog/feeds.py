@@ -0,0 +1,130 @@
+"""
+RSS и Atom опубликованных статей: общие и по автору.
+
+XML не строится на запрос: он хранится в файлах BLOG_FEED_DIR и
+пересобирается хуком публикации (blog.hooks.update_feeds) - только общие
+ленты и ленты автора изменённой статьи. Файл заменяется атомарно и не
+перезаписывается, если содержимое не изменилось, поэтому ETag и
+Last-Modified берутся из stat() и ответ 304 не читает даже сам файл.
+Отсутствующая лента (первый запрос, новый автор) собирается на месте.
+После импорта и seed_blog ленты пересобирает задача refresh_feeds.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.text import Truncator
+
+from .models import Post
+from .tasks import task
+
+
+FORMATS = {
+    'rss': (Rss201rev2Feed, 'application/rss+xml; charset=utf-8'),
+    'atom': (Atom1Feed, 'application/atom+xml; charset=utf-8'),
+}
+
+# Слов содержания в описании записи
+DESCRIPTION_WORDS = 60
+
+
+def feed_file(fmt, author_id=None):
+    name = f'author-{author_id}' if author_id else 'all'
+    return Path(settings.BLOG_FEED_DIR) / f'{name}.{fmt}.xml'
+
+
+def _absolute(path):
+    return settings.BLOG_SITE_URL.rstrip('/') + path
+
+
+def build_feed(fmt, author=None):
+    """XML ленты (bytes) из последних BLOG_FEED_ITEMS опубликованных статей"""
+    posts = (
+        Post.objects.filter(is_published=True)
+        .select_related('author')
+        .only('id', 'title', 'content', 'created_at', 'updated_at', 'author__username')
+        .order_by('-created_at', '-id')
+    )
+    if author is not None:
+        posts = posts.filter(author=author)
+        title = f'Мой Блог - {author.username}'
+        feed_url = reverse('author_feed', args=[author.username, fmt])
+    else:
+        title = 'Мой Блог'
+        feed_url = reverse('feed', args=[fmt])
+
+    feed_class, _ = FORMATS[fmt]
+    feed = feed_class(
+        title=title,
+        link=_absolute(reverse('home')),
+        description='Последние статьи',
+        language='ru',
+        feed_url=_absolute(feed_url),
+    )
+    for post in posts[:settings.BLOG_FEED_ITEMS]:
+        url = _absolute(reverse('post_detail', args=[post.pk]))
+        feed.add_item(
+            title=post.title,
+            link=url,
+            unique_id=url,
+            description=Truncator(post.content).words(DESCRIPTION_WORDS),
+            author_name=post.author.username,
+            pubdate=post.created_at,
+            updateddate=post.updated_at,
+        )
+    return feed.writeString('utf-8').encode()
+
+
+def write_feed(fmt, author=None):
+    """Пересобирает файл ленты; возвращает True, если содержимое изменилось"""
+    path = feed_file(fmt, author.pk if author else None)
+    content = build_feed(fmt, author)
+    try:
+        if path.read_bytes() == content:
+            return False
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # Читатели видят либо старый, либо новый файл целиком
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.feed-')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def rebuild_feeds(author=None):
+    """Общие ленты и, если указан автор, его ленты во всех форматах"""
+    for fmt in FORMATS:
+        write_feed(fmt)
+        if author is not None:
+            write_feed(fmt, author)
+
+
+# Массовая загрузка (импорт, seed_blog) идёт bulk_create без сигналов и хуков
+@task()
+def refresh_feeds(author_ids=()):
+    """Пересобирает общие ленты и ленты перечисленных авторов"""
+    for fmt in FORMATS:
+        write_feed(fmt)
+    for author in User.objects.filter(pk__in=author_ids).only('id', 'username'):
+        for fmt in FORMATS:
+            write_feed(fmt, author)
+
+
+def feed_stat(fmt, author=None):
+    """os.stat_result файла ленты; отсутствующая лента собирается"""
+    path = feed_file(fmt, author.pk if author else None)
+    try:
+        return path, path.stat()
+    except FileNotFoundError:
+        write_feed(fmt, author)
+        return path, path.stat()
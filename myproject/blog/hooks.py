@@ -0,0 +1,54 @@
+"""
+Хуки публикации статей; выполняются воркером run_tasks (см. blog.tasks).
+
+Инвалидация кэша остаётся синхронной в сигналах - это дешёвая смена
+версии. Поисковый индекс обновляют триггеры БД (blog.search), отдельный
+хук для него не нужен.
+"""
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import Http404, HttpRequest
+from django.urls import reverse
+
+from .feeds import rebuild_feeds
+from .tasks import UNPUBLISHED, publish_hook
+
+
+def _anonymous_request(path):
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.user = AnonymousUser()
+
+    async def auser():
+        return request.user
+
+    request.auser = auser
+    return request
+
+
+@publish_hook(setting='BLOG_WARM_CACHE')
+def warm_post_pages(post_id, author_id, event):
+    """
+    Рендерит страницу статьи и списки так, как их увидит анонимный посетитель,
+    заполняя кэш фрагментов (и страниц при BLOG_PAGE_CACHE). Ставится в очередь
+    только при BLOG_WARM_CACHE (по умолчанию - с общим CACHE_BACKEND): кэш
+    в памяти процесса воркера веб-воркерам не виден.
+    """
+    if event == UNPUBLISHED:
+        return
+    from . import views
+
+    async_to_sync(views.home)(_anonymous_request(reverse('home')))
+    async_to_sync(views.post_list)(_anonymous_request(reverse('post_list')))
+    try:
+        async_to_sync(views.post_detail)(_anonymous_request(reverse('post_detail', args=[post_id])), pk=post_id)
+    except Http404:
+        # Статью успели снять с публикации или удалить
+        pass
+
+
+@publish_hook
+def update_feeds(post_id, author_id, event):
+    """Пересобирает только затронутые ленты: общие и ленты автора статьи"""
+    rebuild_feeds(User.objects.filter(pk=author_id).only('id', 'username').first())
@@ -0,0 +1,332 @@
+"""
+Массовый импорт статей (и их комментариев) из NDJSON или CSV.
+
+Файл читается потоком; записи собираются в пачки, авторы ищутся по username
+через кэш в памяти (недостающие дочитываются одним запросом на пачку),
+статьи и комментарии вставляются bulk_create в одной транзакции на пачку.
+В той же транзакции сдвигается ImportJob.rows_done, поэтому после сбоя
+импорт продолжается ровно с первой незакоммиченной записи. Перед запуском
+импорт забирается сменой статуса (claim), так что один и тот же импорт не
+выполняют одновременно два процесса. Из админки импорт выполняется
+фоновой задачей import_file.
+
+NDJSON - формат export_blog: {"title", "content", "author", "created_at",
+"is_published", "comments": [{"id", "parent", "author", "content", "created_at"}]}.
+parent - id комментария той же статьи из файла; новые id выдаёт БД, а дерево
+ответов (parent, path, depth) строится заново.
+CSV - заголовок title,content,author[,created_at][,is_published], без комментариев.
+"""
+import csv
+import itertools
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_lists
+from .feeds import refresh_feeds
+from .models import Comment, ImportJob, Post, path_segment
+from .tasks import enqueue, task
+
+
+logger = logging.getLogger('blog.importer')
+
+FORMATS = ('ndjson', 'csv')
+
+# Выполняемый импорт, не сдвигавший позицию дольше этого, считается брошенным
+STALE_AFTER = timedelta(minutes=10)
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on', 'да'}
+
+
+class JobBusy(Exception):
+    """Импорт уже выполняется другим процессом"""
+
+
+class RowError(ValueError):
+    """Запись не прошла проверку"""
+
+
+def detect_format(name):
+    return 'csv' if str(name).lower().endswith('.csv') else 'ndjson'
+
+
+def read_records(fh, fmt):
+    """(номер записи, сырая запись) - разбор откладывается до пропуска уже импортированных"""
+    if fmt == 'csv':
+        reader = csv.DictReader(fh)
+        return enumerate(reader, 1)
+    return enumerate((line for line in fh if line.strip()), 1)
+
+
+def _parse_record(raw, fmt):
+    if fmt == 'csv':
+        return raw
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        raise RowError(f'некорректный JSON: {exc.msg}')
+    if not isinstance(data, dict):
+        raise RowError('ожидался JSON-объект')
+    return data
+
+
+def _text(data, field, max_length=None):
+    value = data.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise RowError(f'поле {field} обязательно')
+    if max_length and len(value) > max_length:
+        raise RowError(f'поле {field} длиннее {max_length} символов')
+    return value
+
+
+def _datetime(data, field, default):
+    value = data.get(field)
+    if value in (None, ''):
+        return default
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise RowError(f'поле {field}: ожидалась дата ISO 8601')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+class AuthorCache:
+    """username -> id; неизвестные имена дочитываются (и при желании создаются) пачкой"""
+
+    def __init__(self, create_missing=False):
+        self.ids = {}
+        self.create_missing = create_missing
+        self._password = make_password(None)
+
+    def load(self, usernames):
+        missing = set(usernames) - self.ids.keys()
+        if not missing:
+            return
+        self.ids.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+        missing -= self.ids.keys()
+        if missing and self.create_missing:
+            User.objects.bulk_create(
+                [User(username=name, password=self._password) for name in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.ids.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+
+    def get(self, username):
+        try:
+            return self.ids[username]
+        except KeyError:
+            raise RowError(f'автор {username!r} не найден')
+
+
+def _usernames(record):
+    names = []
+    if isinstance(record.get('author'), str):
+        names.append(record['author'])
+    comments = record.get('comments')
+    if isinstance(comments, list):
+        names += [c['author'] for c in comments if isinstance(c, dict) and isinstance(c.get('author'), str)]
+    return names
+
+
+def _comment_ref(raw, field):
+    value = raw.get(field)
+    if value is None or (isinstance(value, (int, str)) and not isinstance(value, bool)):
+        return value
+    raise RowError(f'поле {field}: ожидался id комментария')
+
+
+def _parents_first(comments):
+    """Комментарии в порядке уровней дерева: родитель раньше ответов"""
+    ordered = []
+    placed = set()
+    remaining = comments
+    while remaining:
+        level = [c for c in remaining if c.parent is None or id(c.parent) in placed]
+        if not level:
+            raise RowError('ответы комментариев образуют цикл')
+        placed.update(id(c) for c in level)
+        ordered += level
+        remaining = [c for c in remaining if id(c) not in placed]
+    return ordered
+
+
+def build_post(record, authors, now):
+    """(Post, [Comment]) из проверенной записи; comment_count заполнен заранее"""
+    post = Post(
+        title=_text(record, 'title', Post._meta.get_field('title').max_length),
+        content=_text(record, 'content'),
+        author_id=authors.get(_text(record, 'author')),
+        created_at=_datetime(record, 'created_at', now),
+        is_published=_bool(record.get('is_published', False)),
+    )
+    comments = []
+    parent_refs = []
+    by_ref = {}
+    raw_comments = record.get('comments') or []
+    if not isinstance(raw_comments, list):
+        raise RowError('comments должен быть списком')
+    for index, raw in enumerate(raw_comments):
+        if not isinstance(raw, dict):
+            raise RowError(f'комментарий {index}: ожидался объект')
+        try:
+            comment = Comment(
+                author_id=authors.get(_text(raw, 'author')),
+                content=_text(raw, 'content'),
+                created_at=_datetime(raw, 'created_at', post.created_at),
+            )
+            ref = _comment_ref(raw, 'id')
+            parent_refs.append(_comment_ref(raw, 'parent'))
+        except RowError as exc:
+            raise RowError(f'комментарий {index}: {exc}')
+        if ref is not None:
+            by_ref[ref] = comment
+        comments.append(comment)
+    for index, (comment, parent_ref) in enumerate(zip(comments, parent_refs)):
+        if parent_ref is None:
+            continue
+        if parent_ref not in by_ref:
+            raise RowError(f'комментарий {index}: ответ на неизвестный комментарий {parent_ref!r}')
+        comment.parent = by_ref[parent_ref]
+    post.comment_count = len(comments)
+    return post, _parents_first(comments)
+
+
+def _insert(posts_with_comments):
+    posts = Post.objects.bulk_create([post for post, _ in posts_with_comments])
+    comments = []
+    for post, post_comments in posts_with_comments:
+        for comment in post_comments:
+            comment.post_id = post.pk
+            comments.append(comment)
+    # Счётчики уже посчитаны в build_post, поэтому минуем CommentQuerySet.bulk_create.
+    # Ответу нужен id родителя, поэтому вставка идёт по уровням дерева (build_post
+    # уже упорядочил их), а пути, оканчивающиеся собственным id, пишутся одним UPDATE
+    insert = models.QuerySet(Comment)
+    remaining = comments
+    while remaining:
+        level = [c for c in remaining if c.parent is None or c.parent.pk is not None]
+        remaining = [c for c in remaining if c.parent is not None and c.parent.pk is None]
+        prefixes = [c.attach_to(c.parent) if c.parent is not None else '' for c in level]
+        insert.bulk_create(level)
+        for comment, prefix in zip(level, prefixes):
+            comment.path = prefix + path_segment(comment.pk)
+    if comments:
+        insert.bulk_update(comments, ['path'])
+    return len(posts), len(comments)
+
+
+def claim(job):
+    """
+    Переводит импорт в RUNNING, если он ждёт, упал или брошен упавшим
+    процессом; иначе JobBusy. Позиция перечитывается из БД.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(
+        Q(status__in=[ImportJob.PENDING, ImportJob.FAILED])
+        | Q(status=ImportJob.RUNNING, updated_at__lt=now - STALE_AFTER),
+        pk=job.pk,
+    ).update(status=ImportJob.RUNNING, updated_at=now)
+    if not claimed:
+        raise JobBusy(f'импорт #{job.pk} уже выполняется или завершён')
+    job.refresh_from_db()
+
+
+def run_import(job, fh, batch_size=1000, max_errors=100, progress=None):
+    """
+    Забирает импорт (claim) и импортирует записи файла, пропуская уже
+    учтённые в job.rows_done.
+
+    progress(job, batch_rows, rows_per_second, errors) вызывается после
+    каждой пачки; errors - список (номер записи, текст) отклонённых записей.
+    """
+    claim(job)
+    authors = AuthorCache(create_missing=job.create_authors)
+    records = itertools.islice(read_records(fh, job.format), job.rows_done, None)
+    started = time.monotonic()
+    rows_since_start = rejected_since_start = 0
+    # Авторы опубликованных статей: их ленты (и общие) пересобираются в конце
+    feed_authors = set()
+    try:
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            parsed, errors = [], []
+            for number, raw in batch:
+                try:
+                    parsed.append((number, _parse_record(raw, job.format)))
+                except RowError as exc:
+                    errors.append((number, str(exc)))
+            authors.load(name for _, record in parsed for name in _usernames(record))
+
+            now = timezone.now()
+            rows = []
+            for number, record in parsed:
+                try:
+                    rows.append(build_post(record, authors, now))
+                except RowError as exc:
+                    errors.append((number, str(exc)))
+
+            with transaction.atomic():
+                posts, comments = _insert(rows) if rows else (0, 0)
+                feed_authors.update(post.author_id for post, _ in rows if post.is_published)
+                job.rows_done = batch[-1][0]
+                job.posts_created += posts
+                job.comments_created += comments
+                job.rows_rejected += len(errors)
+                if errors:
+                    job.last_error = '; '.join(f'запись {n}: {text}' for n, text in errors[-5:])
+                job.save()
+
+            rows_since_start += len(batch)
+            rejected_since_start += len(errors)
+            if progress:
+                progress(job, len(batch), rows_since_start / max(time.monotonic() - started, 1e-6), errors)
+            if rejected_since_start > max_errors:
+                raise RowError(f'отклонено записей больше {max_errors}')
+    except Exception as exc:
+        job.status = ImportJob.FAILED
+        job.last_error = str(exc)
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        raise
+    finally:
+        if job.posts_created:
+            invalidate_lists()
+        if feed_authors:
+            enqueue(refresh_feeds, author_ids=sorted(feed_authors))
+
+    job.status = ImportJob.DONE
+    job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def open_source(path):
+    # utf-8-sig: CSV из Excel начинается с BOM
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+# Повтор не нужен: упавший импорт продолжают вручную, с места остановки
+@task(max_attempts=1)
+def import_file(job_id):
+    """Фоновая задача импорта, поставленного из админки"""
+    job = ImportJob.objects.get(pk=job_id)
+    try:
+        with open_source(job.source) as fh:
+            run_import(job, fh)
+    except JobBusy as exc:
+        logger.info("Импорт не запущен: %s", exc)
@@ -0,0 +1,90 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from blog.benchmarks import CASES, LiveWSGIServer, run_case, run_case_http, run_session_modes, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет временную тестовую БД и замеряет эндпоинты блога: RPS, p50/p95/p99, "
+        "SQL-запросы и память на запрос. Результаты можно сохранить в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--comments', type=int, default=2000)
+        parser.add_argument('--iterations', type=int, default=100, help="Запросов тестовым клиентом на сценарий")
+        parser.add_argument('--http-requests', type=int, default=300, help="Запросов через WSGI-сервер на сценарий")
+        parser.add_argument('--concurrency', type=int, default=10, help="Одновременных HTTP-клиентов")
+        parser.add_argument('--no-http', action='store_true', help="Не запускать WSGI-сервер")
+        parser.add_argument(
+            '--case', action='append', dest='cases', choices=[case.name for case in CASES],
+            help="Только указанные сценарии (можно повторять)",
+        )
+        parser.add_argument(
+            '--session-mode', action='append', dest='session_modes',
+            choices=list(settings.BLOG_SESSION_ENGINES),
+            help="Прогнать сценарии с входом под указанным хранилищем сессий (можно повторять)",
+        )
+        parser.add_argument('--label', default='', help="Метка прогона для сравнения")
+        parser.add_argument('--json', dest='json_path', help="Сохранить отчёт в JSON-файл")
+
+    def handle(self, *args, **options):
+        cases = [case for case in CASES if not options['cases'] or case.name in options['cases']]
+        # Как и тесты, работаем в отдельной БД, рабочие данные не трогаем
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self._run(cases, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for result in results:
+            line = (
+                f"{result['driver']:6} {result['case']:18} {result.get('session', ''):14} {result['rps']:>8} req/s  "
+                f"p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms"
+            )
+            if result['driver'] == 'client':
+                line += f"  SQL {result['queries']:>3}  память {result['peak_kib']} КиБ"
+            else:
+                line += f"  ошибок {result['errors']}"
+            self.stdout.write(line)
+
+        if options['json_path']:
+            report = {
+                'label': options['label'],
+                'started_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'session': settings.BLOG_SESSION_MODE,
+                'dataset': {key: options[key] for key in ('users', 'posts', 'comments')},
+                'results': results,
+            }
+            with open(options['json_path'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    def _run(self, cases, options):
+        user, post = seed(options['users'], options['posts'], options['comments'])
+        if post is None:
+            raise CommandError("Нужна хотя бы одна опубликованная статья (--posts)")
+
+        results = [run_case(case, post, user, options['iterations']) for case in cases if not case.login]
+        modes = options['session_modes'] or [settings.BLOG_SESSION_MODE]
+        results += run_session_modes(cases, post, user, modes, options['iterations'])
+        if not options['no_http']:
+            with LiveWSGIServer() as base_url:
+                results += [
+                    run_case_http(base_url, case, post, options['http_requests'], options['concurrency'])
+                    for case in cases if case.http
+                ]
+        return results
@@ -0,0 +1,43 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from blog.benchmarks import fetch, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает запущенный сервер (например, gunicorn с sync- и uvicorn-воркерами) "
+        "и печатает RPS и задержки p50/p95/p99 по каждому URL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="Полные URL, например http://localhost:8000/posts/")
+        parser.add_argument('--requests', type=int, default=500, help="Запросов на каждый URL")
+        parser.add_argument('--concurrency', type=int, default=20, help="Одновременных клиентов")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--label', default='', help="Метка прогона, например sync или asgi")
+        parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON-файл")
+
+    def handle(self, *args, urls, requests, concurrency, timeout, label, json_path, **options):
+        results = []
+        for url in urls:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda _: fetch(url, timeout), range(requests)))
+            elapsed = time.perf_counter() - started
+
+            result = {'label': label, 'url': url, 'concurrency': concurrency}
+            result.update(summarize([latency for latency, _ in samples], elapsed))
+            result['errors'] = sum(1 for _, ok in samples if not ok)
+            results.append(result)
+            self.stdout.write(
+                f"{label or '-'} {url}: {result['rps']} req/s, "
+                f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, ошибок {result['errors']}"
+            )
+
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as fh:
+                json.dump(results, fh, ensure_ascii=False, indent=2)
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog.benchmarks import run_template_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время рендера списка статей без кэша шаблонов, со стандартным "
+        "кэширующим загрузчиком и с blog.template_loaders.Loader"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=50, help="Карточек на странице")
+        parser.add_argument('--iterations', type=int, default=300)
+        parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON-файл")
+
+    def handle(self, *args, cards, iterations, json_path, **options):
+        results = run_template_benchmark(cards, iterations)
+        for result in results:
+            self.stdout.write(
+                f"{result['variant']:12} mean {result['mean_ms']:>7} ms  p50 {result['p50_ms']:>7} ms  "
+                f"p95 {result['p95_ms']:>7} ms  экономия {result['saving_pct']}%"
+            )
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as fh:
+                json.dump(results, fh, ensure_ascii=False, indent=2)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from blog.export import FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает все статьи с вложенными комментариями в NDJSON или JSON-массив, "
+        "читая БД курсорами: память не растёт с объёмом данных"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help="Файл (по умолчанию stdout)")
+        parser.add_argument('--published-only', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Строк на одно чтение курсора")
+
+    def handle(self, *args, fmt, output, published_only, chunk_size, **options):
+        chunks = export_chunks(fmt, published_only=published_only, chunk_size=chunk_size)
+        if output:
+            with open(output, 'w', encoding='utf-8') as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+            return
+        for chunk in chunks:
+            self.stdout.write(chunk, ending='')
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.importer import FORMATS, JobBusy, RowError, detect_format, open_source, run_import
+from blog.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует статьи с комментариями из NDJSON (формат export_blog) или CSV "
+        "пачками bulk_create; после сбоя продолжает с места остановки (--resume)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=FORMATS, help="По умолчанию - по расширению файла")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Записей в одной транзакции")
+        parser.add_argument('--create-authors', action='store_true',
+                            help="Создавать отсутствующих авторов (без возможности входа)")
+        parser.add_argument('--max-errors', type=int, default=100, help="Прервать после стольких отклонённых записей")
+        parser.add_argument('--resume', action='store_true',
+                            help="Продолжить последний незавершённый импорт этого файла")
+
+    def handle(self, *args, path, fmt, batch_size, create_authors, max_errors, resume, **options):
+        fmt = fmt or detect_format(path)
+        job = None
+        if resume:
+            job = (
+                ImportJob.objects.filter(source=path, format=fmt)
+                .exclude(status=ImportJob.DONE)
+                .first()
+            )
+            if job is None:
+                raise CommandError(f"Незавершённого импорта {path} нет")
+            self.stdout.write(f"Продолжаем импорт #{job.pk} с записи {job.rows_done + 1}")
+        if job is None:
+            job = ImportJob.objects.create(source=path, format=fmt, create_authors=create_authors)
+        elif create_authors and not job.create_authors:
+            job.create_authors = True
+            job.save(update_fields=['create_authors'])
+
+        try:
+            with open_source(path) as fh:
+                run_import(job, fh, batch_size, max_errors, progress=self._progress)
+        except JobBusy as exc:
+            raise CommandError(f"Импорт не запущен: {exc}")
+        except (OSError, RowError) as exc:
+            raise CommandError(f"Импорт #{job.pk} прерван: {exc}. Продолжить: --resume")
+        self.stdout.write(self.style.SUCCESS(
+            f"Импорт #{job.pk} завершён: статей {job.posts_created}, "
+            f"комментариев {job.comments_created}, отклонено {job.rows_rejected}"
+        ))
+
+    def _progress(self, job, batch_rows, rows_per_second, errors):
+        for number, text in errors:
+            self.stderr.write(f"запись {number}: {text}")
+        self.stdout.write(
+            f"записей {job.rows_done}, статей {job.posts_created}, "
+            f"комментариев {job.comments_created}, {rows_per_second * 60:.0f} записей/мин"
+        )
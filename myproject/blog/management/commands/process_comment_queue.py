@@ -0,0 +1,55 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blog.comment_queue import flush, queue_depth
+
+
+logger = logging.getLogger('blog.comment_queue')
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер отложенной записи комментариев (BLOG_COMMENT_QUEUE=1): переносит "
+        "комментарии из очереди в блог пачками, по транзакции на пачку"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help="Пауза, когда очередь пуста, секунды")
+        parser.add_argument('--once', action='store_true', help="Разобрать очередь и выйти")
+        parser.add_argument(
+            '--metrics-port', type=int,
+            help="Отдавать метрики воркера (записанные комментарии, время пачки) на этом порту",
+        )
+
+    def handle(self, *args, batch_size, interval, once, metrics_port, **options):
+        if metrics_port:
+            from prometheus_client import start_http_server
+            start_http_server(metrics_port)
+
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    flushed = flush(batch_size)
+                except Exception:
+                    # Пачка откатилась целиком и будет взята снова
+                    logger.exception("Не удалось записать пачку комментариев")
+                    if once:
+                        raise
+                    time.sleep(interval)
+                    continue
+                total += flushed
+                if flushed:
+                    logger.info("Записано комментариев: %d, в очереди: %d", flushed, queue_depth())
+                if flushed < batch_size:
+                    if once:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Записано комментариев: {total}")
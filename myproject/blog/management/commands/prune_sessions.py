@@ -0,0 +1,49 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет просроченные сессии из БД короткими транзакциями по --batch-size строк. "
+        "В отличие от clearsessions не держит блокировки на всю таблицу и пропускает "
+        "строки, заблокированные текущими запросами (SKIP LOCKED в PostgreSQL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Пауза между пачками, секунды")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать просроченные сессии")
+
+    def handle(self, *args, batch_size, sleep, dry_run, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            self.stdout.write(f"Сессии не хранятся в БД ({settings.SESSION_ENGINE}), удалять нечего")
+            return
+        model = store.get_model_class()
+        using = router.db_for_write(model)
+        # Граница фиксируется один раз: сессии, истёкшие во время работы, дождутся следующего запуска
+        expired = model.objects.using(using).filter(expire_date__lt=timezone.now())
+        if dry_run:
+            self.stdout.write(f"Просроченных сессий: {expired.count()}")
+            return
+
+        deleted = 0
+        while True:
+            with transaction.atomic(using=using):
+                keys = list(
+                    expired.select_for_update(skip_locked=True)
+                    .order_by('expire_date')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not keys:
+                    break
+                deleted += model.objects.using(using).filter(pk__in=keys).delete()[0]
+            self.stdout.write(f"Удалено {deleted}")
+            if sleep:
+                time.sleep(sleep)
+        self.stdout.write(self.style.SUCCESS(f"Просроченные сессии удалены: {deleted}"))
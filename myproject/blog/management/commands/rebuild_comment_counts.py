@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from blog.cache import invalidate_comment_counts
+from blog.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает Post.comment_count и исправляет расхождения с реальным числом комментариев"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        actual = Coalesce(Subquery(
+            Comment.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ), 0)
+        drifted = list(
+            Post.objects.annotate(actual=actual)
+            .exclude(comment_count=F('actual'))
+            .values_list('pk', flat=True)
+            .order_by('pk')
+        )
+        self.stdout.write(f"Статей с неверным счётчиком: {len(drifted)}")
+        if dry_run:
+            return
+
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            with transaction.atomic():
+                Post.objects.filter(pk__in=batch).update(comment_count=actual)
+            invalidate_comment_counts(batch)
+        self.stdout.write(self.style.SUCCESS("Счётчики комментариев пересчитаны"))
@@ -0,0 +1,83 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from blog.tasks import claim, execute, execute_pooled, init_process, purge_done, requeue_stale
+
+
+logger = logging.getLogger('blog.tasks')
+
+# Как часто возвращать зависшие задачи в очередь и чистить выполненные, секунды
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер фоновых задач (хуки публикации статей): забирает задачи из таблицы "
+        "Task и выполняет их в пуле потоков или процессов, упавшие повторяет"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.BLOG_TASKS_CONCURRENCY,
+            help="Одновременно выполняемых задач; 1 - в основном потоке без пула",
+        )
+        parser.add_argument('--pool', choices=['thread', 'process'], default=settings.BLOG_TASKS_POOL)
+        parser.add_argument('--interval', type=float, default=1.0, help="Пауза, когда задач нет, секунды")
+        parser.add_argument(
+            '--lease', type=int, default=300,
+            help="Через сколько секунд выполняемая задача считается брошенной и возвращается в очередь",
+        )
+        parser.add_argument('--keep-done', type=int, default=86400, help="Сколько секунд хранить выполненные задачи")
+        parser.add_argument('--once', action='store_true', help="Выполнить готовые задачи и выйти")
+
+    def handle(self, *args, concurrency, pool, interval, lease, keep_done, once, **options):
+        concurrency = max(1, concurrency)
+        executor = None
+        if concurrency > 1 and pool == 'process':
+            # Дочерние процессы не должны унаследовать открытые соединения
+            connections.close_all()
+            executor = ProcessPoolExecutor(concurrency, initializer=init_process)
+        elif concurrency > 1:
+            executor = ThreadPoolExecutor(concurrency, thread_name_prefix='blog-task')
+
+        in_flight = set()
+        processed = 0
+        last_maintenance = 0.0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                    requeue_stale(lease)
+                    purge_done(keep_done)
+                    last_maintenance = time.monotonic()
+
+                ids = claim(concurrency - len(in_flight)) if len(in_flight) < concurrency else []
+                if executor is None:
+                    for task_id in ids:
+                        execute(task_id)
+                    processed += len(ids)
+                else:
+                    in_flight.update(executor.submit(execute_pooled, task_id) for task_id in ids)
+
+                if in_flight:
+                    # Только что взяли задачи - сразу пробуем взять ещё, иначе ждём освобождения пула
+                    finished, in_flight = wait(in_flight, timeout=0 if ids else interval, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        processed += 1
+                        if future.exception() is not None:
+                            logger.error("Сбой воркера задач", exc_info=future.exception())
+                elif not ids:
+                    if once:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.stdout.write(f"Обработано задач: {processed}")
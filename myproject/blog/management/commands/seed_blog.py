@@ -0,0 +1,231 @@
+import math
+import multiprocessing
+import random
+import secrets
+import time
+from array import array
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, models, transaction
+from django.utils import timezone
+
+from blog.benchmarks import WORDS
+from blog.cache import invalidate_lists
+from blog.feeds import refresh_feeds
+from blog.models import Comment, Post
+from blog.search import disable_search_triggers, enable_search_triggers
+from blog.tasks import enqueue, init_process
+
+
+# Общий корпус текста: срезы по случайному смещению дешевле генерации по словам
+CORPUS_CHARS = 1_000_000
+
+# Длины в символах: логнормальное распределение (медиана, разброс, пределы)
+POST_LENGTH = (1500, 0.8, 200, 50_000)
+COMMENT_LENGTH = (150, 0.9, 5, 3_000)
+TITLE_LENGTH = (50, 0.3, 10, 200)
+
+
+def _corpus(rng):
+    words = []
+    size = 0
+    while size < CORPUS_CHARS:
+        word = rng.choice(WORDS)
+        if rng.random() < 0.08:
+            word += rng.choice('.,!?')
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+
+def _text(rng, corpus, distribution):
+    median, sigma, low, high = distribution
+    length = int(min(high, max(low, rng.lognormvariate(math.log(median), sigma))))
+    start = rng.randrange(len(corpus) - length)
+    return corpus[start:start + length].strip()
+
+
+def _plan_comments(rng, options):
+    """Сколько комментариев получит статья: горячие - тысячи, остальные - единицы"""
+    if rng.random() < options['hot_ratio']:
+        return int(rng.lognormvariate(math.log(options['hot_comments']), 0.5))
+    return int(rng.expovariate(1 / options['comments_per_post'])) if options['comments_per_post'] else 0
+
+
+def _seed_posts(task):
+    """Создаёт count статей; счётчик comment_count сразу равен плану комментариев"""
+    offset, count, author_ids, options = task
+    rng = random.Random(f"{options['seed']}:posts:{offset}")
+    corpus = _corpus(rng)
+    now = timezone.now()
+    span = options['days'] * 86400
+    created = 0
+    while created < count:
+        size = min(options['batch_size'], count - created)
+        posts = []
+        for _ in range(size):
+            is_published = rng.random() < options['published_ratio']
+            posts.append(Post(
+                title=_text(rng, corpus, TITLE_LENGTH).capitalize(),
+                content=_text(rng, corpus, POST_LENGTH),
+                author_id=rng.choice(author_ids),
+                created_at=now - timedelta(seconds=rng.uniform(0, span)),
+                is_published=is_published,
+                comment_count=_plan_comments(rng, options) if is_published else 0,
+            ))
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+        created += size
+    return count, 0
+
+
+def _seed_comments(task):
+    """Создаёт запланированные комментарии статьям с id в [first_id, last_id]"""
+    first_id, last_id, author_ids, options = task
+    rng = random.Random(f"{options['seed']}:comments:{first_id}")
+    corpus = _corpus(rng)
+    now = timezone.now()
+    # Счётчики уже выставлены при создании статей, поэтому обходим
+    # CommentQuerySet.bulk_create с его UPDATE на каждую статью
+    insert = models.QuerySet(Comment).bulk_create
+    posts = (
+        Post.objects.filter(pk__range=(first_id, last_id), comment_count__gt=0)
+        .values_list('pk', 'created_at', 'comment_count')
+        .order_by('pk')
+    )
+    batch = []
+    total = 0
+    for post_id, post_created_at, planned in posts.iterator(chunk_size=2000):
+        age = max(1.0, (now - post_created_at).total_seconds())
+        for _ in range(planned):
+            # Большинство комментариев приходит вскоре после публикации
+            delay = min(age, rng.expovariate(1 / min(age, 3 * 86400)))
+            batch.append(Comment(
+                post_id=post_id,
+                author_id=rng.choice(author_ids),
+                content=_text(rng, corpus, COMMENT_LENGTH),
+                created_at=post_created_at + timedelta(seconds=delay),
+            ))
+            if len(batch) >= options['batch_size']:
+                with transaction.atomic():
+                    insert(batch)
+                    Comment.objects.filter(post_id__in={c.post_id for c in batch}).fill_root_paths()
+                total += len(batch)
+                batch = []
+    if batch:
+        with transaction.atomic():
+            insert(batch)
+            Comment.objects.filter(post_id__in={c.post_id for c in batch}).fill_root_paths()
+        total += len(batch)
+    return 0, total
+
+
+def _in_worker(job):
+    func, task = job
+    try:
+        return func(task)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД большим объёмом правдоподобных данных: статьи разной длины, "
+        "горячие статьи с тысячами комментариев. Пишет пачками bulk_create в транзакциях, "
+        "при --workers > 1 - в нескольких процессах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments-per-post', type=float, default=5,
+                            help="Среднее число комментариев у обычной статьи")
+        parser.add_argument('--hot-ratio', type=float, default=0.001, help="Доля горячих статей")
+        parser.add_argument('--hot-comments', type=int, default=2000,
+                            help="Типичное число комментариев у горячей статьи")
+        parser.add_argument('--published-ratio', type=float, default=0.9)
+        parser.add_argument('--days', type=int, default=3 * 365, help="За сколько дней распределить статьи")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Строк в одной транзакции")
+        parser.add_argument('--chunk-size', type=int, default=50_000, help="Статей в одной задаче воркера")
+        parser.add_argument('--workers', type=int, default=1, help="Процессов генерации")
+        parser.add_argument('--seed', type=int, default=None, help="Зерно генератора для воспроизводимости")
+
+    def handle(self, *args, **options):
+        if options['posts'] < 0 or options['users'] < 1 or options['batch_size'] < 1:
+            raise CommandError("Нужны --users >= 1, --posts >= 0 и --batch-size >= 1")
+        if options['seed'] is None:
+            options['seed'] = secrets.randbits(32)
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite допускает одного писателя, процессы только ждали бы блокировку
+            self.stderr.write("SQLite: параллельная запись невозможна, работаем в одном процессе")
+            workers = 1
+
+        started = time.monotonic()
+        author_ids = self._create_users(options)
+        # Построчные триггеры поискового индекса заметно замедляют вставку,
+        # поэтому на время загрузки они отключены, а новые строки индексируются
+        # пачками в конце. Поиск по старым строкам всё это время работает.
+        unindexed = disable_search_triggers(connection)
+        try:
+            first_id = (Post.objects.aggregate(last=models.Max('pk'))['last'] or 0) + 1
+            chunk = options['chunk_size']
+            post_tasks = [
+                (offset, min(chunk, options['posts'] - offset), author_ids, options)
+                for offset in range(0, options['posts'], chunk)
+            ]
+            self._run(_seed_posts, post_tasks, workers, started)
+
+            last_id = Post.objects.aggregate(last=models.Max('pk'))['last'] or 0
+            comment_tasks = [
+                (start, min(start + chunk - 1, last_id), author_ids, options)
+                for start in range(first_id, last_id + 1, chunk)
+            ]
+            self._run(_seed_comments, comment_tasks, workers, started)
+        finally:
+            self.stdout.write("Индексируем новые строки для поиска...")
+            enable_search_triggers(connection, unindexed)
+        invalidate_lists()
+        # Лент новых авторов ещё нет (соберутся при первом запросе), устарели только общие
+        enqueue(refresh_feeds)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.monotonic() - started:.0f} с (зерно {options['seed']})"
+        ))
+
+    def _create_users(self, options):
+        password = make_password(None)  # войти под сгенерированными пользователями нельзя
+        prefix = f"seed-{secrets.token_hex(3)}-"
+        for start in range(0, options['users'], options['batch_size']):
+            stop = min(start + options['batch_size'], options['users'])
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [User(username=f'{prefix}{i}', password=password) for i in range(start, stop)]
+                )
+        return array('q', User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+
+    def _run(self, func, tasks, workers, started):
+        posts = comments = 0
+        if workers > 1:
+            # Дочерние процессы не должны унаследовать открытые соединения
+            connections.close_all()
+            # При запуске через spawn процессы сами настраивают Django
+            with multiprocessing.Pool(workers, initializer=init_process) as pool:
+                results = pool.imap_unordered(_in_worker, [(func, task) for task in tasks])
+                for done, result in enumerate(results, 1):
+                    posts, comments = posts + result[0], comments + result[1]
+                    self._progress(done, len(tasks), posts, comments, started)
+        else:
+            for done, task in enumerate(tasks, 1):
+                result = func(task)
+                posts, comments = posts + result[0], comments + result[1]
+                self._progress(done, len(tasks), posts, comments, started)
+
+    def _progress(self, done, total, posts, comments, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rows = posts + comments
+        self.stdout.write(
+            f"[{done}/{total}] статей {posts}, комментариев {comments}, {rows / elapsed:.0f} строк/с"
+        )
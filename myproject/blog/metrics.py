@@ -0,0 +1,216 @@
+"""
+Метрики Prometheus: задержки и число запросов по имени URL, запросы
+в обработке, SQL-запросы, пул соединений, попадания в кэш, очередь
+комментариев и состояние воркеров.
+
+Под gunicorn каждый воркер - отдельный процесс. Если задана переменная
+PROMETHEUS_MULTIPROC_DIR (её выставляет gunicorn.conf.py), prometheus_client
+пишет значения в файлы этого каталога, а /metrics собирает их со всех
+живых воркеров, какой бы из них ни обработал запрос.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+REQUEST_LATENCY = Histogram(
+    'blog_http_request_duration_seconds',
+    "Время обработки запроса",
+    ['view', 'method'],
+)
+REQUESTS = Counter(
+    'blog_http_requests_total',
+    "Обработанные запросы",
+    ['view', 'method', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'blog_http_requests_in_flight',
+    "Запросы в обработке",
+    multiprocess_mode='livesum',
+)
+REQUEST_QUERIES = Histogram(
+    'blog_http_request_db_queries',
+    "SQL-запросов на один HTTP-запрос",
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+DB_QUERIES = Counter(
+    'blog_db_queries_total',
+    "Выполненные SQL-запросы",
+    ['alias'],
+)
+CACHE_REQUESTS = Counter(
+    'blog_cache_requests_total',
+    "Обращения к кэшу HTML; доля попаданий - hit / (hit + miss)",
+    ['cache', 'result'],
+)
+COMMENT_QUEUE_DEPTH = Gauge(
+    'blog_comment_queue_depth',
+    "Комментариев в очереди на запись (на момент снятия метрик)",
+    multiprocess_mode='mostrecent',
+)
+COMMENT_QUEUE_ENQUEUED = Counter(
+    'blog_comment_queue_enqueued_total',
+    "Комментарии, поставленные в очередь",
+)
+COMMENT_QUEUE_REJECTED = Counter(
+    'blog_comment_queue_rejected_total',
+    "Комментарии, отклонённые из-за переполнения очереди",
+)
+# Следующие метрики пишет воркер process_comment_queue (--metrics-port)
+COMMENT_QUEUE_FLUSHED = Counter(
+    'blog_comment_queue_flushed_total',
+    "Комментарии, записанные воркером очереди",
+)
+COMMENT_QUEUE_FLUSH_SECONDS = Histogram(
+    'blog_comment_queue_flush_seconds',
+    "Время записи одной пачки комментариев",
+)
+COMMENT_QUEUE_LAG_SECONDS = Histogram(
+    'blog_comment_queue_lag_seconds',
+    "Время от постановки комментария в очередь до записи",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+# Пул соединений psycopg_pool (DB_POOL=1); значения снимаются в конце каждого
+# запроса (blog.db), суммы по живым воркерам - общая картина
+DB_POOL_SIZE = Gauge(
+    'blog_db_pool_size',
+    "Соединений в пуле (занятых и свободных)",
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_AVAILABLE = Gauge(
+    'blog_db_pool_available',
+    "Свободных соединений в пуле",
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_WAITING = Gauge(
+    'blog_db_pool_requests_waiting',
+    "Запросов, ждущих соединение из пула",
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+WORKERS = Gauge(
+    'blog_workers',
+    "Живые процессы-воркеры приложения",
+    multiprocess_mode='livesum',
+)
+WORKER_STARTED = Gauge(
+    'blog_worker_start_time_seconds',
+    "Время запуска воркера (unix)",
+    multiprocess_mode='liveall',
+)
+WORKER_MAX_RSS = Gauge(
+    'blog_worker_max_rss_bytes',
+    "Пиковый объём памяти воркера",
+    multiprocess_mode='liveall',
+)
+
+_queries = ContextVar('blog_request_queries', default=None)
+
+# Этот процесс - воркер
+WORKERS.set(1)
+WORKER_STARTED.set(time.time())
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def _count_query(execute, sql, params, many, context):
+    DB_QUERIES.labels(context['connection'].alias).inc()
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _instrument_connection(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_instrument_connection)
+
+
+class PrometheusMetricsMiddleware:
+    """Должна стоять первой в MIDDLEWARE, чтобы учитывать всю обработку"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        # Соединения, открытые до импорта модуля (например, в тестах)
+        for connection in connections.all(initialized_only=True):
+            _instrument_connection(connection=connection)
+        IN_FLIGHT.inc()
+        return time.perf_counter(), _queries.set([0])
+
+    def _finish(self, request, response, started, token):
+        duration = time.perf_counter() - started
+        queries = _queries.get()[0]
+        _queries.reset(token)
+        IN_FLIGHT.dec()
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        REQUEST_LATENCY.labels(view, request.method).observe(duration)
+        REQUESTS.labels(view, request.method, response.status_code if response is not None else 500).inc()
+        REQUEST_QUERIES.labels(view).observe(queries)
+        if resource is not None:
+            # ru_maxrss в Linux - в килобайтах
+            WORKER_MAX_RSS.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, token = self._start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, response, started, token)
+        return response
+
+    async def __acall__(self, request):
+        started, token = self._start()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, response, started, token)
+        return response
+
+
+def metrics_view(request):
+    """Экспозиция метрик в текстовом формате Prometheus"""
+    if settings.BLOG_COMMENT_QUEUE:
+        # Не на уровне модуля: models импортирует metrics через cache
+        from .comment_queue import queue_depth
+        COMMENT_QUEUE_DEPTH.set(queue_depth())
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from blog.search import install_search_index
+
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from blog.search import uninstall_search_index
+
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_post_comment_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
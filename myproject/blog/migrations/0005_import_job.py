@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=500, verbose_name="Файл")),
+                ("format", models.CharField(max_length=10, verbose_name="Формат")),
+                (
+                    "create_authors",
+                    models.BooleanField(
+                        default=False, verbose_name="Создавать авторов"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Выполняется"),
+                            ("failed", "Ошибка"),
+                            ("done", "Завершён"),
+                        ],
+                        default="running",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "rows_done",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Обработано записей"
+                    ),
+                ),
+                (
+                    "posts_created",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Создано статей"
+                    ),
+                ),
+                (
+                    "comments_created",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Создано комментариев"
+                    ),
+                ),
+                (
+                    "rows_rejected",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Отклонено записей"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Последняя ошибка"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создан"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Обновлён"),
+                ),
+            ],
+            options={
+                "verbose_name": "Импорт",
+                "verbose_name_plural": "Импорты",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
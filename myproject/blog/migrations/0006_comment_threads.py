@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Value
+from django.db.models.functions import Cast, LPad
+
+
+def fill_root_paths(apps, schema_editor):
+    # Все существующие комментарии - верхнего уровня; пачками по id, каждая
+    # в своей транзакции (миграция не атомарна), чтобы не держать блокировки
+    # всех строк до конца миграции
+    Comment = apps.get_model("blog", "Comment")
+    last_id = Comment.objects.aggregate(last=Max("pk"))["last"] or 0
+    for start in range(0, last_id + 1, 10000):
+        Comment.objects.filter(pk__gte=start, pk__lt=start + 10000).update(
+            path=LPad(Cast("pk", models.CharField()), 10, Value("0"))
+        )
+
+
+class Migration(migrations.Migration):
+    # Иначе в PostgreSQL все пачки fill_root_paths - одна транзакция
+    atomic = False
+
+    dependencies = [
+        ("blog", "0005_import_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(
+                default=0, editable=False, verbose_name="Уровень"
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="blog.comment",
+                verbose_name="Ответ на",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(default="", editable=False, max_length=250),
+        ),
+        migrations.RunPython(fill_root_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="blog_comment_post_path_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0008_task"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="importjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В очереди"),
+                    ("running", "Выполняется"),
+                    ("failed", "Ошибка"),
+                    ("done", "Завершён"),
+                ],
+                default="pending",
+                max_length=10,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Greatest, LPad
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .cache import invalidate_comment_counts
+
 
 class Post(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
@@ -10,26 +18,289 @@ class Post(models.Model):
     created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     is_published = models.BooleanField(default=False, verbose_name="Опубликовано")
+    # Денормализованный счётчик, поддерживается сигналами blog.signals
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментариев")
 
     class Meta:
         verbose_name = "Статья"
         verbose_name_plural = "Статьи"
         ordering = ['-created_at']
+        indexes = [
+            # Публичные списки: только опубликованные, свежие сверху (+ id для курсоров)
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_published=True),
+                name='blog_post_published_idx',
+            ),
+            # "Мои статьи"
+            models.Index(fields=['author', '-created_at'], name='blog_post_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Сигналам нужно знать, была ли статья опубликована до сохранения
+        instance._loaded_is_published = instance.__dict__.get('is_published')
+        return instance
+
+    @staticmethod
+    def adjust_comment_count(post_id, delta):
+        """Атомарно меняет счётчик комментариев прямо в БД"""
+        Post.objects.filter(pk=post_id).update(
+            comment_count=Greatest(F('comment_count') + delta, 0)
+        )
+
+
+# Сегмент пути комментария - его id, дополненный нулями до одной ширины:
+# строки из цифр сравниваются одинаково при любой сортировке (collation) БД
+PATH_STEP = 10
+MAX_DEPTH = 25
+PATH_MAX_LENGTH = PATH_STEP * MAX_DEPTH
+
+
+def path_segment(pk):
+    return str(pk).zfill(PATH_STEP)
+
+
+# Уменьшения счётчиков при удалении комментариев пачкой: сигнал post_delete
+# копит их здесь, и на статью выполняется один UPDATE (см. blog.signals)
+_deleted_comments = ContextVar('blog_deleted_comments', default=None)
+
+
+def defer_comment_decrement(post_id):
+    """Учитывает удалённый комментарий в текущей пачке; False - пачки нет"""
+    counts = _deleted_comments.get()
+    if counts is None:
+        return False
+    counts[post_id] += 1
+    return True
+
+
+@contextmanager
+def _grouped_comment_decrements(using):
+    counts = Counter()
+    token = _deleted_comments.set(counts)
+    try:
+        with transaction.atomic(using=using):
+            yield
+            for post_id, deleted in counts.items():
+                Post.adjust_comment_count(post_id, -deleted)
+            if counts:
+                invalidate_comment_counts(counts)
+    finally:
+        _deleted_comments.reset(token)
+
+
+class CommentQuerySet(models.QuerySet):
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, update_conflicts=False, **kwargs):
+        """
+        bulk_create не шлёт сигналов, поэтому счётчики обновляются здесь.
+        Пачкой создаются только комментарии верхнего уровня, ответ - ValueError.
+        Пропуск или обновление конфликтующих строк не поддерживается: пропущенные
+        строки попали бы в comment_count.
+        """
+        if ignore_conflicts or update_conflicts:
+            raise ValueError("Комментарии нельзя создавать пачкой с ignore_conflicts/update_conflicts")
+        objs = list(objs)
+        if any(obj.parent_id is not None or obj.parent is not None for obj in objs):
+            # Путь ответа строится от пути родителя, а fill_root_paths дал бы корневой
+            raise ValueError("Ответы нельзя создавать пачкой: путь в дереве строит Comment.save")
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, batch_size=batch_size, **kwargs)
+            post_ids = Counter(obj.post_id for obj in objs)
+            self.filter(post_id__in=post_ids).fill_root_paths()
+            for obj in objs:
+                if obj.pk is not None and not obj.path:
+                    obj.path = path_segment(obj.pk)
+            for post_id, delta in post_ids.items():
+                Post.adjust_comment_count(post_id, delta)
+            if post_ids:
+                invalidate_comment_counts(post_ids)
+        return objs
+
+    def delete(self):
+        """Удаление с ответами (каскад); счётчики - одним UPDATE на статью"""
+        with _grouped_comment_decrements(self.db):
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def fill_root_paths(self):
+        """Путь для вставленных пачкой комментариев (id известен только после INSERT)"""
+        return self.filter(path='').update(
+            path=LPad(Cast('pk', models.CharField()), PATH_STEP, Value('0'))
+        )
+
+    def subtree(self, comment):
+        """Комментарий со всеми ответами любой глубины - диапазон по индексу (post, path)"""
+        return self.filter(
+            post_id=comment.post_id,
+            path__gte=comment.path,
+            path__lte=comment.path.ljust(PATH_MAX_LENGTH, '9'),
+        )
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name="Статья")
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Автор")
     content = models.TextField(verbose_name="Комментарий")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='replies', verbose_name="Ответ на",
+    )
+    # Материализованный путь: сегменты id всех предков и самого комментария.
+    # Ветка целиком - один диапазон по индексу (post, path), см. CommentQuerySet.subtree
+    path = models.CharField(max_length=PATH_MAX_LENGTH, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень")
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['created_at']
+        indexes = [
+            # Комментарии статьи в хронологическом порядке
+            models.Index(fields=['post', 'created_at'], name='blog_comment_post_created_idx'),
+            # Комментарии статьи в порядке дерева и ветки (диапазоны по path)
+            models.Index(fields=['post', 'path'], name='blog_comment_post_path_idx'),
+        ]
 
     def __str__(self):
         return f"Комментарий от {self.author.username} к статье {self.post.title}"
+
+    def delete(self, using=None, keep_parents=False):
+        # Вместе с комментарием каскадом удаляются все ответы
+        with _grouped_comment_decrements(using or router.db_for_write(type(self), instance=self)):
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    def attach_to(self, parent):
+        """Ставит ответ под parent; возвращает путь-префикс для собственного сегмента"""
+        if parent.depth >= MAX_DEPTH - 1:
+            # Глубже не вкладываем: ответ встаёт рядом с родителем
+            self.parent_id = parent.parent_id
+            self.depth = parent.depth
+            return parent.path[:-PATH_STEP]
+        self.parent_id = parent.pk
+        self.depth = parent.depth + 1
+        return parent.path
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding and not self.path
+        if adding and self.parent_id is not None:
+            prefix = self.attach_to(self.parent)
+        else:
+            prefix = ''
+        if not adding:
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            # Сегмент - собственный id, поэтому путь дописывается после INSERT
+            self.path = prefix + path_segment(self.pk)
+            type(self).objects.using(using).filter(pk=self.pk).update(path=self.path)
+
+
+class PendingComment(models.Model):
+    """Комментарий в очереди на запись (BLOG_COMMENT_QUEUE), см. blog.comment_queue"""
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', verbose_name="Статья")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Автор")
+    parent = models.ForeignKey(
+        Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="Ответ на",
+    )
+    content = models.TextField(verbose_name="Комментарий")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Комментарий в очереди"
+        verbose_name_plural = "Комментарии в очереди"
+        ordering = ['id']
+        indexes = [
+            # Свои ожидающие комментарии автора на странице статьи
+            models.Index(fields=['post', 'author'], name='blog_pending_post_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Комментарий от {self.author.username} к статье {self.post.title} (в очереди)"
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди без брокера, см. blog.tasks"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Задача")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="Аргументы")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запустить после")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-created_at']
+        indexes = [
+            # Выбор готовых к запуску задач воркером
+            models.Index(fields=['run_at'], condition=models.Q(status='queued'), name='blog_task_due_idx'),
+            # Поиск зависших задач (воркер упал во время выполнения)
+            models.Index(fields=['started_at'], condition=models.Q(status='running'), name='blog_task_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class ImportJob(models.Model):
+    """Импорт статей из файла; хранит позицию для продолжения после сбоя"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (FAILED, "Ошибка"),
+        (DONE, "Завершён"),
+    ]
+
+    source = models.CharField(max_length=500, verbose_name="Файл")
+    format = models.CharField(max_length=10, verbose_name="Формат")
+    create_authors = models.BooleanField(default=False, verbose_name="Создавать авторов")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    # Записей файла, обработанных в закоммиченных пачках (включая отклонённые)
+    rows_done = models.PositiveBigIntegerField(default=0, verbose_name="Обработано записей")
+    posts_created = models.PositiveBigIntegerField(default=0, verbose_name="Создано статей")
+    comments_created = models.PositiveBigIntegerField(default=0, verbose_name="Создано комментариев")
+    rows_rejected = models.PositiveBigIntegerField(default=0, verbose_name="Отклонено записей")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлён")
+
+    class Meta:
+        verbose_name = "Импорт"
+        verbose_name_plural = "Импорты"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.source} ({self.get_status_display()})"
@@ -0,0 +1,125 @@
+import re
+from datetime import datetime
+from functools import cached_property
+
+from django.core import signing
+from django.db.models import Q
+
+from .models import PATH_MAX_LENGTH
+
+
+CURSOR_SALT = 'blog.pagination.cursor'
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или подделан"""
+
+
+def encode_cursor(created_at, pk, reverse=False):
+    """Упаковывает позицию (created_at, id) в непрозрачную строку"""
+    return signing.dumps(
+        {'c': created_at.isoformat(), 'i': pk, 'r': reverse},
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор, возвращает (created_at, id, reverse)"""
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+        return datetime.fromisoformat(data['c']), int(data['i']), bool(data['r'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def _cursor_window(queryset, cursor, page_size):
+    """Запрос на page_size + 1 строк от позиции курсора"""
+    if cursor is None:
+        return queryset.order_by('-created_at', '-id')[:page_size + 1], False, False
+    created_at, pk, reverse = decode_cursor(cursor)
+    if reverse:
+        newer = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        return queryset.filter(newer).order_by('created_at', 'id')[:page_size + 1], True, True
+    older = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    return queryset.filter(older).order_by('-created_at', '-id')[:page_size + 1], True, False
+
+
+def _build_page(rows, page_size, from_cursor, reverse):
+    if reverse:
+        has_next, has_previous = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+    else:
+        has_next, has_previous = len(rows) > page_size, from_cursor
+        rows = rows[:page_size]
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    if rows and has_previous:
+        previous_cursor = encode_cursor(rows[0]['created_at'], rows[0]['id'], reverse=True)
+    return rows, next_cursor, previous_cursor
+
+
+def paginate_by_cursor(queryset, cursor, page_size):
+    """
+    Keyset-пагинация по (created_at, id) в порядке Post.Meta.ordering.
+
+    queryset должен отдавать строки с ключами 'created_at' и 'id'.
+    Возвращает (rows, next_cursor, previous_cursor). Новые записи
+    не сдвигают уже выданные страницы, а стоимость запроса не растёт
+    с глубиной, в отличие от OFFSET.
+    """
+    window, from_cursor, reverse = _cursor_window(queryset, cursor, page_size)
+    return _build_page(list(window), page_size, from_cursor, reverse)
+
+
+async def apaginate_by_cursor(queryset, cursor, page_size):
+    """Асинхронный вариант paginate_by_cursor"""
+    window, from_cursor, reverse = _cursor_window(queryset, cursor, page_size)
+    return _build_page([row async for row in window], page_size, from_cursor, reverse)
+
+
+# Путь комментария - открытый курсор: любая строка цифр лишь позиция в индексе
+PATH_CURSOR_RE = re.compile(rf'\d{{1,{PATH_MAX_LENGTH}}}')
+
+
+class CommentPage:
+    """
+    Keyset-страница комментариев в порядке дерева (Comment.path).
+
+    after - путь последнего показанного комментария; следующая страница -
+    первые page_size строк с path > after по индексу (post, path), поэтому
+    её стоимость не зависит ни от номера страницы, ни от числа комментариев.
+    Запрос выполняется при первом обращении - в шаблоне, внутри кэшируемого
+    фрагмента, его может и не быть.
+    """
+
+    def __init__(self, queryset, after, page_size):
+        if after and not PATH_CURSOR_RE.fullmatch(after):
+            raise InvalidCursor(after)
+        self.after = after or None
+        self.page_size = page_size
+        self.queryset = queryset.filter(path__gt=after) if after else queryset
+
+    def _window(self):
+        return self.queryset.order_by('path')[:self.page_size + 1]
+
+    @cached_property
+    def _rows(self):
+        return list(self._window())
+
+    async def aload(self):
+        """Выполняет запрос асинхронно (для асинхронных view без шаблона)"""
+        self.__dict__['_rows'] = [row async for row in self._window()]
+        return self
+
+    @property
+    def comments(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def next_cursor(self):
+        if len(self._rows) > self.page_size:
+            return self._rows[self.page_size - 1].path
+        return None
@@ -0,0 +1,185 @@
+"""
+Профилирование запросов: время ответа, время и число SQL-запросов,
+повторяющиеся запросы (признак N+1) и время рендера шаблонов.
+
+Для доли запросов ``settings.BLOG_PROFILING_SAMPLE_RATE`` middleware
+добавляет заголовок Server-Timing и пишет JSON-строку в лог ``blog.profiling``;
+запросы дольше ``BLOG_SLOW_REQUEST_MS`` логируются как WARNING вместе с SQL.
+При нулевой доле middleware отключается при старте (MiddlewareNotUsed)
+и не стоит ничего.
+
+Замеры собираются в contextvar, поэтому работают и для асинхронных view:
+sync_to_async копирует контекст в поток, где выполняется ORM.
+"""
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько SQL-запросов сохранять для лога медленного запроса
+MAX_CAPTURED_QUERIES = 100
+
+_current = ContextVar('blog_request_profile', default=None)
+_original_template_render = Template.render
+_installed = False
+
+
+class RequestProfile:
+    __slots__ = ('started', 'queries', 'db_time', 'template_time', 'template_depth', 'sql_counts', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.sql_counts = Counter()
+        self.statements = []
+
+    @property
+    def duplicate_queries(self):
+        """Лишние выполнения одинакового SQL (с точностью до параметров)"""
+        return sum(count - 1 for count in self.sql_counts.values() if count > 1)
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        profile.queries += 1
+        profile.db_time += duration
+        profile.sql_counts[sql] += 1
+        if len(profile.statements) < MAX_CAPTURED_QUERIES:
+            profile.statements.append((sql, duration))
+
+
+def _timed_template_render(self, context=None, request=None):
+    profile = _current.get()
+    if profile is None:
+        return _original_template_render(self, context, request)
+    # Шаблон, отрендеренный внутри другого, уже учтён во внешнем
+    profile.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_template_render(self, context, request)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_time += time.perf_counter() - started
+
+
+def _instrument_connection(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    """Подключает сбор SQL ко всем соединениям и замер рендера шаблонов"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_instrument_connection)
+    Template.render = _timed_template_render
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.BLOG_PROFILING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.slow_seconds = settings.BLOG_SLOW_REQUEST_MS / 1000
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def _start(self):
+        if random.random() >= self.sample_rate:
+            return None, None
+        # Соединения, открытые до install(), инструментируются здесь
+        for connection in connections.all(initialized_only=True):
+            _instrument_connection(connection=connection)
+        profile = RequestProfile()
+        return profile, _current.set(profile)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token = self._start()
+        if profile is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile, token = self._start()
+        if profile is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, profile)
+        return response
+
+    def _finish(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        timing = (
+            f'total;dur={_ms(total)}, '
+            f'db;dur={_ms(profile.db_time)};desc="{profile.queries} queries, '
+            f'{profile.duplicate_queries} duplicates", '
+            f'template;dur={_ms(profile.template_time)}'
+        )
+        if response.has_header('Server-Timing'):
+            timing = f"{response.headers['Server-Timing']}, {timing}"
+        response.headers['Server-Timing'] = timing
+
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'db_ms': _ms(profile.db_time),
+            'queries': profile.queries,
+            'duplicate_queries': profile.duplicate_queries,
+            'template_ms': _ms(profile.template_time),
+        }
+        if total < self.slow_seconds:
+            logger.info(json.dumps(record, ensure_ascii=False), extra={'profile': record})
+            return
+        record['sql'] = [{'sql': sql, 'ms': _ms(duration)} for sql, duration in profile.statements]
+        record['duplicated_sql'] = [
+            {'sql': sql, 'count': count} for sql, count in profile.sql_counts.most_common(5) if count > 1
+        ]
+        logger.warning(json.dumps(record, ensure_ascii=False), extra={'profile': record})
@@ -0,0 +1,118 @@
+"""
+Чтение с реплик PostgreSQL (DB_REPLICA_HOSTS) и запись в основную БД.
+
+Реплики используются только внутри GET/HEAD-запросов, помеченных
+ReplicaStickinessMiddleware; команды, POST-запросы и всё остальное
+читают из default, чтобы не видеть отставание реплик. Если запрос что-то
+записал (комментарий, статья, сессия при входе), его автору ставится cookie,
+и следующие BLOG_REPLICA_STICKY_SECONDS секунд он читает из основной БД -
+видит свои изменения, даже если реплика ещё не догнала.
+
+По той же причине кэш не должен получать HTML, собранный по данным реплики
+сразу после записи: см. read_from_replica() и pin_primary() в blog.cache.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+STICKY_COOKIE = 'blog_primary_until'
+
+_state = ContextVar('blog_db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'wrote', 'read_replica')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+        self.read_replica = False
+
+
+def read_from_replica():
+    """Читал ли текущий запрос что-нибудь с реплики"""
+    state = _state.get()
+    return state is not None and state.read_replica
+
+
+def pin_primary():
+    """До конца текущего запроса читать из основной БД"""
+    state = _state.get()
+    if state is not None:
+        state.use_replica = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or not settings.BLOG_DB_REPLICAS:
+            return None
+        state.read_replica = True
+        return random.choice(settings.BLOG_DB_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальше в этом запросе читаем то, что только что записали
+            state.wrote = True
+            state.use_replica = False
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.BLOG_DB_REPLICAS
+
+
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.BLOG_DB_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = RoutingState(use_replica=request.method in ('GET', 'HEAD') and not pinned)
+        return state, _state.set(state)
+
+    def _finish(self, response, state):
+        if state.wrote:
+            seconds = settings.BLOG_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + seconds),
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(response, state)
@@ -0,0 +1,423 @@
+"""
+Полнотекстовый поиск по статьям и комментариям.
+
+PostgreSQL: колонки ``search_vector`` (tsvector) в blog_post и blog_comment,
+GIN-индексы и триггеры, пересчитывающие вектор при вставке и изменении
+текста, с конфигурацией ``settings.BLOG_SEARCH_CONFIG`` (russian - стемминг).
+SQLite: внешние FTS5-таблицы с триггерами. Стеммера для русского в FTS5 нет,
+поэтому слова ищутся по префиксу. Для других СУБД - медленный icontains.
+
+Колонки и таблицы не описаны в моделях: они целиком принадлежат СУБД и
+создаются install_search_index() из миграции. После каждого migrate
+ensure_search_triggers() возвращает потерянные триггеры (пересоздание
+таблиц в SQLite удаляет их).
+"""
+import re
+from contextlib import nullcontext
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+# Маркеры подсветки, которых не бывает в тексте; заменяются на <mark> после экранирования
+START_SEL, STOP_SEL = '\x02', '\x03'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_TABLES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5(
+        title, content, content='blog_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_comment_fts USING fts5(
+        content, content='blog_comment', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+]
+
+SQLITE_TRIGGERS = {
+    'blog_post_fts_insert': """CREATE TRIGGER IF NOT EXISTS blog_post_fts_insert AFTER INSERT ON blog_post BEGIN
+        INSERT INTO blog_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    'blog_post_fts_delete': """CREATE TRIGGER IF NOT EXISTS blog_post_fts_delete AFTER DELETE ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    'blog_post_fts_update': """CREATE TRIGGER IF NOT EXISTS blog_post_fts_update
+        AFTER UPDATE OF title, content ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    'blog_comment_fts_insert': """CREATE TRIGGER IF NOT EXISTS blog_comment_fts_insert AFTER INSERT ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    'blog_comment_fts_delete': """CREATE TRIGGER IF NOT EXISTS blog_comment_fts_delete AFTER DELETE ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    'blog_comment_fts_update': """CREATE TRIGGER IF NOT EXISTS blog_comment_fts_update
+        AFTER UPDATE OF content ON blog_comment BEGIN
+        INSERT INTO blog_comment_fts(blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO blog_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+}
+
+SQLITE_REBUILD = [
+    "INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')",
+    "INSERT INTO blog_comment_fts(blog_comment_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TABLE IF EXISTS blog_post_fts",
+    "DROP TABLE IF EXISTS blog_comment_fts",
+] + [f"DROP TRIGGER IF EXISTS {name}" for name in SQLITE_TRIGGERS]
+
+# Таблица и текстовые колонки, вектор которых хранится в search_vector
+POSTGRES_TABLES = {'blog_post': 'title, content', 'blog_comment': 'content'}
+
+
+def _postgres_triggers(config):
+    """{имя триггера: операторы, создающие его функцию и сам триггер}"""
+    vectors = {
+        'blog_post': (
+            f"setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') || "
+            f"setweight(to_tsvector('{config}', coalesce(NEW.content, '')), 'B')"
+        ),
+        'blog_comment': f"to_tsvector('{config}', coalesce(NEW.content, ''))",
+    }
+    return {
+        f'{table}_search_vector_trigger': [
+            f"""CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {vectors[table]};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql""",
+            f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}",
+            f"""CREATE TRIGGER {table}_search_vector_trigger
+                BEFORE INSERT OR UPDATE OF {columns} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()""",
+        ]
+        for table, columns in POSTGRES_TABLES.items()
+    }
+
+
+def _postgres_install(config):
+    triggers = _postgres_triggers(config)
+    statements = []
+    for table, columns in POSTGRES_TABLES.items():
+        first = columns.split(',')[0]
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+            *triggers[f'{table}_search_vector_trigger'],
+            # Пустое обновление запускает триггер и заполняет вектор у старых строк
+            f"UPDATE {table} SET {first} = {first} WHERE search_vector IS NULL",
+            f"CREATE INDEX IF NOT EXISTS {table}_search_gin ON {table} USING gin (search_vector)",
+        ]
+    return statements
+
+
+POSTGRES_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS blog_post_search_vector_trigger ON blog_post",
+    "DROP FUNCTION IF EXISTS blog_post_search_vector_update()",
+    "ALTER TABLE blog_post DROP COLUMN IF EXISTS search_vector",
+    "DROP TRIGGER IF EXISTS blog_comment_search_vector_trigger ON blog_comment",
+    "DROP FUNCTION IF EXISTS blog_comment_search_vector_update()",
+    "ALTER TABLE blog_comment DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_search_index(conn=connection):
+    """Создаёт (идемпотентно) поисковые индексы и поддерживающие их триггеры"""
+    if conn.vendor == 'postgresql':
+        statements = _postgres_install(settings.BLOG_SEARCH_CONFIG)
+    elif conn.vendor == 'sqlite':
+        statements = SQLITE_TABLES + list(SQLITE_TRIGGERS.values()) + SQLITE_REBUILD
+    else:
+        return
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(conn=connection):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def ensure_search_triggers(conn=connection):
+    """
+    Восстанавливает недостающие триггеры установленного индекса, не
+    переиндексируя строки. Пересоздание таблицы в миграции SQLite теряет
+    триггеры, но сохраняет id, так что FTS-таблицы остаются верными.
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'blog_post' AND column_name = 'search_vector'"
+            )
+            if cursor.fetchone() is None:
+                return
+            cursor.execute("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal")
+            triggers = _postgres_triggers(settings.BLOG_SEARCH_CONFIG)
+        elif conn.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'blog_post_fts'")
+            if cursor.fetchone() is None:
+                return
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = {name: [sql] for name, sql in SQLITE_TRIGGERS.items()}
+        else:
+            return
+        existing = {row[0] for row in cursor.fetchall()}
+        for name, statements in triggers.items():
+            if name not in existing:
+                for statement in statements:
+                    cursor.execute(statement)
+
+
+# Таблица: (FTS-таблица SQLite, её колонки, триггер вставки)
+SQLITE_INDEXED = {
+    'blog_post': ('blog_post_fts', 'title, content', 'blog_post_fts_insert'),
+    'blog_comment': ('blog_comment_fts', 'content', 'blog_comment_fts_insert'),
+}
+
+
+def _next_ids(cursor, tables):
+    first_ids = {}
+    for table in tables:
+        cursor.execute(f"SELECT max(id) FROM {table}")
+        first_ids[table] = (cursor.fetchone()[0] or 0) + 1
+    return first_ids
+
+
+def disable_search_triggers(conn=connection):
+    """
+    Отключает индексацию вставляемых строк на время массовой загрузки.
+    Поиск по уже проиндексированным строкам продолжает работать. Возвращает
+    {таблица: первый id без индекса} для enable_search_triggers().
+    """
+    if conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            # ALTER TABLE дождётся начатых вставок - их строки уже с вектором,
+            # а строки между границей и отключением пропустит условие IS NULL
+            first_ids = _next_ids(cursor, POSTGRES_TABLES)
+            for table in POSTGRES_TABLES:
+                cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER {table}_search_vector_trigger")
+    elif conn.vendor == 'sqlite':
+        # Отключать триггеры SQLite не умеет - удаляем только триггеры вставки.
+        # Граница читается под блокировкой записи, уже без триггеров.
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            for _, _, trigger in SQLITE_INDEXED.values():
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            first_ids = _next_ids(cursor, SQLITE_INDEXED)
+    else:
+        first_ids = {}
+    return first_ids
+
+
+def enable_search_triggers(conn, first_ids, batch_size=10_000):
+    """
+    Включает триггеры обратно и индексирует строки, вставленные после
+    disable_search_triggers(): first_ids - {таблица: первый новый id}.
+    Триггеры включаются до выбора диапазона, поэтому строки, вставленные
+    параллельно, не теряются. В PostgreSQL каждая пачка - своя транзакция,
+    чтобы не держать блокировку таблицы всё время индексации.
+    """
+    if conn.vendor == 'postgresql':
+        block = nullcontext()
+    elif conn.vendor == 'sqlite':
+        block = transaction.atomic(using=conn.alias)
+    else:
+        return
+    with block, conn.cursor() as cursor:
+        for table, first_id in first_ids.items():
+            if conn.vendor == 'postgresql':
+                cursor.execute(f"ALTER TABLE {table} ENABLE TRIGGER {table}_search_vector_trigger")
+                first = POSTGRES_TABLES[table].split(',')[0]
+                backfill = (
+                    f"UPDATE {table} SET {first} = {first} "
+                    f"WHERE id BETWEEN %s AND %s AND search_vector IS NULL"
+                )
+            else:
+                fts, columns, trigger = SQLITE_INDEXED[table]
+                # Запись берёт блокировку БД: до коммита новых строк не появится
+                cursor.execute(SQLITE_TRIGGERS[trigger])
+                backfill = (
+                    f"INSERT INTO {fts}(rowid, {columns}) "
+                    f"SELECT id, {columns} FROM {table} WHERE id BETWEEN %s AND %s"
+                )
+            cursor.execute(f"SELECT max(id) FROM {table}")
+            last_id = cursor.fetchone()[0] or 0
+            for start in range(first_id, last_id + 1, batch_size):
+                cursor.execute(backfill, [start, min(start + batch_size - 1, last_id)])
+
+
+def highlight(text):
+    """Экранирует фрагмент и превращает маркеры совпадений в <mark>"""
+    return mark_safe(escape(text).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>'))
+
+
+def _aware(value):
+    # Сырые запросы к SQLite возвращают naive datetime в UTC
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def _fts5_query(query):
+    # Каждое слово - отдельный терм-префикс в кавычках: пользовательский ввод
+    # не может сломать синтаксис MATCH, а префикс частично заменяет стемминг.
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def _postgres_sql(kind):
+    config = settings.BLOG_SEARCH_CONFIG
+    options = f'StartSel={START_SEL}, StopSel={STOP_SEL}, MaxFragments=2, MaxWords=30, MinWords=10'
+    if kind == 'posts':
+        # Подсветка считается только для строк, прошедших LIMIT
+        return f"""
+            SELECT hit.id, hit.title, u.username, hit.created_at, hit.rank,
+                   ts_headline('{config}', hit.content, hit.query, '{options}')
+            FROM (
+                SELECT p.id, p.title, p.content, p.author_id, p.created_at, q AS query,
+                       ts_rank_cd(p.search_vector, q) AS rank
+                FROM blog_post p, websearch_to_tsquery('{config}', %s) q
+                WHERE p.is_published AND p.search_vector @@ q
+                ORDER BY rank DESC, p.created_at DESC
+                LIMIT %s
+            ) hit
+            JOIN auth_user u ON u.id = hit.author_id
+            ORDER BY hit.rank DESC, hit.created_at DESC
+        """
+    return f"""
+        SELECT hit.id, hit.post_id, hit.title, u.username, hit.created_at, hit.rank,
+               ts_headline('{config}', hit.content, hit.query, '{options}')
+        FROM (
+            SELECT c.id, c.post_id, p.title, c.content, c.author_id, c.created_at, q AS query,
+                   ts_rank_cd(c.search_vector, q) AS rank
+            FROM blog_comment c
+            JOIN blog_post p ON p.id = c.post_id,
+            websearch_to_tsquery('{config}', %s) q
+            WHERE p.is_published AND c.search_vector @@ q
+            ORDER BY rank DESC, c.created_at DESC
+            LIMIT %s
+        ) hit
+        JOIN auth_user u ON u.id = hit.author_id
+        ORDER BY hit.rank DESC, hit.created_at DESC
+    """
+
+
+SQLITE_SQL = {
+    # bm25: меньше - лучше; заголовок весит больше содержания
+    'posts': f"""
+        SELECT p.id, p.title, u.username, p.created_at, -bm25(blog_post_fts, 10.0, 1.0) AS rank,
+               snippet(blog_post_fts, 1, '{START_SEL}', '{STOP_SEL}', '…', 30)
+        FROM blog_post_fts
+        JOIN blog_post p ON p.id = blog_post_fts.rowid
+        JOIN auth_user u ON u.id = p.author_id
+        WHERE blog_post_fts MATCH %s AND p.is_published
+        ORDER BY bm25(blog_post_fts, 10.0, 1.0), p.created_at DESC
+        LIMIT %s
+    """,
+    'comments': f"""
+        SELECT c.id, c.post_id, p.title, u.username, c.created_at, -bm25(blog_comment_fts) AS rank,
+               snippet(blog_comment_fts, 0, '{START_SEL}', '{STOP_SEL}', '…', 30)
+        FROM blog_comment_fts
+        JOIN blog_comment c ON c.id = blog_comment_fts.rowid
+        JOIN blog_post p ON p.id = c.post_id
+        JOIN auth_user u ON u.id = c.author_id
+        WHERE blog_comment_fts MATCH %s AND p.is_published
+        ORDER BY bm25(blog_comment_fts), c.created_at DESC
+        LIMIT %s
+    """,
+}
+
+
+def _fallback_search(kind, query, limit):
+    from .models import Comment, Post
+
+    if kind == 'posts':
+        rows = (
+            Post.objects.filter(is_published=True, content__icontains=query)
+            .values_list('id', 'title', 'author__username', 'created_at', 'content')[:limit]
+        )
+        return [(pk, title, author, created_at, 0.0, content[:200])
+                for pk, title, author, created_at, content in rows]
+    rows = (
+        Comment.objects.filter(post__is_published=True, content__icontains=query)
+        .values_list('id', 'post_id', 'post__title', 'author__username', 'created_at', 'content')[:limit]
+    )
+    return [(pk, post_id, title, author, created_at, 0.0, content[:200])
+            for pk, post_id, title, author, created_at, content in rows]
+
+
+def _run(kind, query, limit):
+    if connection.vendor == 'postgresql':
+        sql, param = _postgres_sql(kind), query
+    elif connection.vendor == 'sqlite':
+        sql, param = SQLITE_SQL[kind], _fts5_query(query)
+        if not param:
+            return []
+    else:
+        return _fallback_search(kind, query, limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [param, limit])
+        return cursor.fetchall()
+
+
+def search_posts(query, limit=20):
+    """Опубликованные статьи по релевантности, с подсвеченным фрагментом"""
+    return [
+        {
+            'id': pk,
+            'title': title,
+            'author': author,
+            'created_at': _aware(created_at),
+            'rank': float(rank),
+            'headline': highlight(headline or ''),
+        }
+        for pk, title, author, created_at, rank, headline in _run('posts', query, limit)
+    ]
+
+
+def search_comments(query, limit=20):
+    """Комментарии к опубликованным статьям по релевантности"""
+    return [
+        {
+            'id': pk,
+            'post_id': post_id,
+            'post_title': title,
+            'author': author,
+            'created_at': _aware(created_at),
+            'rank': float(rank),
+            'headline': highlight(headline or ''),
+        }
+        for pk, post_id, title, author, created_at, rank, headline in _run('comments', query, limit)
+    ]
+
+
+def matching_post_ids(query, limit=1000):
+    """id статей (в т.ч. неопубликованных) для поиска в админке"""
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT id FROM blog_post WHERE search_vector @@ "
+            f"websearch_to_tsquery('{settings.BLOG_SEARCH_CONFIG}', %s) LIMIT %s"
+        )
+        param = query
+    elif connection.vendor == 'sqlite':
+        sql = "SELECT rowid FROM blog_post_fts WHERE blog_post_fts MATCH %s LIMIT %s"
+        param = _fts5_query(query)
+        if not param:
+            return []
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [param, limit])
+        return [row[0] for row in cursor.fetchall()]
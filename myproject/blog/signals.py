@@ -0,0 +1,59 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_comment_counts, invalidate_lists, invalidate_post
+from .models import Comment, Post, defer_comment_decrement
+from .tasks import PUBLISHED, UNPUBLISHED, UPDATED, enqueue_publish_hooks
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Post.adjust_comment_count(instance.post_id, 1)
+        invalidate_comment_counts([instance.post_id])
+    else:
+        invalidate_post(instance.post_id)
+
+
+def _deletes_posts(origin):
+    return isinstance(origin, Post) or (isinstance(origin, QuerySet) and origin.model is Post)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, origin=None, **kwargs):
+    # Комментарии удаляемой статьи: счётчик исчезнет вместе с ней, а кэш
+    # сбросит сигнал удаления статьи
+    if _deletes_posts(origin):
+        return
+    # Удаление через Comment/CommentQuerySet.delete() (в т.ч. массовое в админке)
+    # копит счётчики и обновляет их по разу на статью
+    if defer_comment_decrement(instance.post_id):
+        return
+    Post.adjust_comment_count(instance.post_id, -1)
+    invalidate_comment_counts([instance.post_id])
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_cache(sender, instance, raw=False, **kwargs):
+    invalidate_post(instance.pk)
+    was_published = getattr(instance, '_loaded_is_published', False)
+    # Списки меняются, только если статья видна в них сейчас или была видна до
+    if instance.is_published or was_published:
+        invalidate_lists()
+    instance._loaded_is_published = instance.is_published
+    if raw:
+        return
+    # Остальные последствия публикации - в фоновых задачах
+    if instance.is_published:
+        enqueue_publish_hooks(instance.pk, instance.author_id, UPDATED if was_published else PUBLISHED)
+    elif was_published:
+        enqueue_publish_hooks(instance.pk, instance.author_id, UNPUBLISHED)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_cache(sender, instance, **kwargs):
+    invalidate_post(instance.pk)
+    if instance.is_published:
+        invalidate_lists()
+        enqueue_publish_hooks(instance.pk, instance.author_id, UNPUBLISHED)
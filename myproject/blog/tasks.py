@@ -0,0 +1,169 @@
+"""
+Фоновые задачи без внешнего брокера: очередь - таблица Task в основной БД.
+
+enqueue() вставляет строку в текущей транзакции, поэтому задача попадает
+в очередь, только если изменение (например, публикация статьи) закоммичено.
+Воркер run_tasks забирает готовые задачи с SKIP LOCKED, выполняет их в пуле
+потоков или процессов и повторяет упавшие с растущей задержкой до
+max_attempts раз.
+
+Хуки публикации (@publish_hook) получают (post_id, author_id, event), где event -
+'published', 'updated' или 'unpublished'. Сигнал сохранения статьи ставит
+задачи для всех хуков одной вставкой, сколько бы их ни было.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger('blog.tasks')
+
+PUBLISHED = 'published'
+UPDATED = 'updated'
+UNPUBLISHED = 'unpublished'
+
+
+class TaskSpec:
+    __slots__ = ('func', 'max_attempts', 'retry_delay')
+
+    def __init__(self, func, max_attempts, retry_delay):
+        self.func = func
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+
+_registry = {}
+_publish_hooks = []
+
+
+def task(max_attempts=3, retry_delay=10):
+    """Регистрирует функцию как фоновую задачу; retry_delay - первая пауза перед повтором, секунды"""
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        _registry[func.task_name] = TaskSpec(func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def publish_hook(func=None, *, setting=None):
+    """
+    Задача, выполняемая после публикации, правки или снятия статьи с публикации.
+    С setting хук ставится в очередь, только пока эта настройка истинна.
+    """
+    def decorator(func):
+        if not hasattr(func, 'task_name'):
+            func = task()(func)
+        _publish_hooks.append((func.task_name, setting))
+        return func
+    return decorator if func is None else decorator(func)
+
+
+def _enabled_publish_hooks():
+    return [name for name, setting in _publish_hooks if setting is None or getattr(settings, setting)]
+
+
+def _new_task(name, kwargs):
+    return Task(name=name, kwargs=kwargs, max_attempts=_registry[name].max_attempts)
+
+
+def enqueue(func, **kwargs):
+    """
+    Ставит задачу в очередь. При BLOG_TASKS_EAGER задача выполняется
+    сразу после коммита текущей транзакции, без воркера.
+    """
+    if settings.BLOG_TASKS_EAGER:
+        transaction.on_commit(lambda: func(**kwargs))
+        return None
+    job = _new_task(func.task_name, kwargs)
+    job.save()
+    return job
+
+
+def enqueue_publish_hooks(post_id, author_id, event):
+    names = _enabled_publish_hooks()
+    if not names:
+        return
+    # Автор передаётся явно: после удаления статьи его уже не узнать
+    kwargs = {'post_id': post_id, 'author_id': author_id, 'event': event}
+    if settings.BLOG_TASKS_EAGER:
+        for name in names:
+            transaction.on_commit(lambda func=_registry[name].func: func(**kwargs))
+        return
+    Task.objects.bulk_create([_new_task(name, kwargs) for name in names])
+
+
+def claim(limit):
+    """Помечает до limit готовых задач как выполняемые и возвращает их id"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_at__lte=now)
+            .order_by('run_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if ids:
+            Task.objects.filter(pk__in=ids).update(
+                status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1
+            )
+    return ids
+
+
+def requeue_stale(lease):
+    """Возвращает в очередь задачи, которые выполняются дольше lease секунд (воркер упал)"""
+    stale = Task.objects.filter(status=Task.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=lease))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, last_error='Воркер не завершил задачу'
+    )
+    return failed + stale.update(status=Task.QUEUED)
+
+
+def purge_done(older_than):
+    """Удаляет выполненные задачи старше older_than секунд"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return Task.objects.filter(status=Task.DONE, updated_at__lt=cutoff).delete()[0]
+
+
+def execute(task_id):
+    """Выполняет задачу и сохраняет результат (статус, повтор или ошибку)"""
+    job = Task.objects.get(pk=task_id)
+    spec = _registry.get(job.name)
+    try:
+        if spec is None:
+            raise LookupError(f'Неизвестная задача {job.name}')
+        spec.func(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if spec is not None and job.attempts < job.max_attempts:
+            job.status = Task.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=spec.retry_delay * 2 ** (job.attempts - 1))
+        else:
+            job.status = Task.FAILED
+        logger.warning("Задача %s (%s) упала, попытка %d", job.pk, job.name, job.attempts)
+    else:
+        job.status = Task.DONE
+        job.last_error = ''
+    job.save(update_fields=['status', 'run_at', 'last_error', 'updated_at'])
+    return job.status
+
+
+def execute_pooled(task_id):
+    """execute для потока или процесса пула"""
+    try:
+        return execute(task_id)
+    finally:
+        # Потоки и процессы пула долгоживущие: не держим соединения дольше CONN_MAX_AGE
+        close_old_connections()
+
+
+def init_process():
+    """Инициализатор процессов пула (при запуске через spawn Django не настроен)"""
+    django.setup()
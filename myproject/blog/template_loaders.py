@@ -0,0 +1,77 @@
+"""
+Кэширующий загрузчик шаблонов для продакшена.
+
+Работает как django.template.loaders.cached.Loader, но дополнительно
+связывает {% extends 'имя' %} с уже скомпилированным родителем: при рендере
+ExtendsNode получает готовый Template и не ищет его через загрузчики.
+precompile_templates() вызывается из wsgi.py/asgi.py при старте воркера,
+чтобы первый запрос не платил за разбор шаблонов.
+"""
+from pathlib import Path
+
+from django.apps import apps
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.base import TextNode
+from django.template.loader_tags import ExtendsNode
+from django.template.loaders import cached
+
+
+class ResolvedParent:
+    """Подменяет выражение с именем родителя в ExtendsNode готовым шаблоном"""
+
+    def __init__(self, template, token):
+        self.template = template
+        self.token = token
+
+    def resolve(self, context):
+        return self.template
+
+
+class Loader(cached.Loader):
+    def get_template(self, template_name, skip=None):
+        template = super().get_template(template_name, skip)
+        self._inline_parent(template)
+        return template
+
+    def _inline_parent(self, template):
+        for node in template.nodelist:
+            if isinstance(node, ExtendsNode):
+                break
+            if not isinstance(node, TextNode):
+                return
+        else:
+            return
+        parent_name = node.parent_name
+        # Только литерал без фильтров и не сам шаблон (расширение одноимённого
+        # шаблона из другого каталога требует поиска с пропуском)
+        if (
+            isinstance(parent_name, ResolvedParent)
+            or not isinstance(parent_name.var, str)
+            or parent_name.filters
+            or parent_name.var == template.origin.template_name
+        ):
+            return
+        parent = self.get_template(parent_name.var)
+        node.parent_name = ResolvedParent(parent, parent_name.token)
+
+
+def template_names():
+    """Шаблоны blog/*.html из каталога приложения"""
+    directory = Path(apps.get_app_config('blog').path) / 'templates' / 'blog'
+    return [f'blog/{path.name}' for path in sorted(directory.glob('*.html'))]
+
+
+def precompile_templates():
+    """Компилирует шаблоны блога в кэш движков, использующих этот загрузчик"""
+    names = template_names()
+    compiled = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        if not any(isinstance(loader, Loader) for loader in engine.engine.template_loaders):
+            continue
+        for name in names:
+            engine.get_template(name)
+            compiled += 1
+    return compiled
@@ -0,0 +1,36 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from blog.cache import get_or_render
+
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, post_id):
+        self.nodelist = nodelist
+        self.name = name
+        self.post_id = post_id
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        post_id = self.post_id.resolve(context)
+        return mark_safe(get_or_render(name, post_id, lambda: self.nodelist.render(context)))
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Кэширует содержимое блока до изменения статьи или её комментариев.
+
+    Использование::
+
+        {% cachedfragment 'post_card' post.pk %}...{% endcachedfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает имя фрагмента и id статьи")
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
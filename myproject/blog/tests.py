@@ -1,8 +1,35 @@
-from django.test import TestCase, Client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.template import engines
+from django.template.loader import render_to_string
+from django.template.loader_tags import ExtendsNode
 from django.urls import reverse
 from django.utils import timezone
-from .models import Post, Comment
+from django.utils.http import http_date
+from . import benchmarks, comment_queue, feeds, hooks, importer, profiling, routers, tasks
+from .cache import fragment_stats, get_version, page_stats, post_scope, reset_stats
+from .db import pool_stats
+from .management.commands import run_tasks
+from .models import Post, Comment, ImportJob, PendingComment, Task
+from .search import search_posts
+from .template_loaders import ResolvedParent, precompile_templates, template_names
 
 
 class PostModelTest(TestCase):
@@ -71,6 +98,105 @@ class CommentModelTest(TestCase):
         self.assertEqual(str(self.comment), expected)
 
 
+class CommentCountTests(TestCase):
+    """Проверка денормализованного счётчика Post.comment_count"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.post = Post.objects.create(
+            title='Test Post',
+            content='This is a test post content',
+            author=self.user,
+            is_published=True
+        )
+
+    def _add_comments(self, count):
+        return [
+            Comment.objects.create(post=self.post, author=self.user, content=f'Comment {i}')
+            for i in range(count)
+        ]
+
+    def test_counter_follows_create_and_delete(self):
+        """Тест обновления счётчика при создании и удалении"""
+        comments = self._add_comments(3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        comments[0].delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_counter_follows_queryset_delete(self):
+        """Тест массового удаления (как в админке)"""
+        self._add_comments(4)
+        Comment.objects.filter(post=self.post).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def _counter_updates(self, queries):
+        return [q for q in queries if q['sql'].startswith('UPDATE') and 'comment_count' in q['sql']]
+
+    def test_delete_updates_counter_once_per_post(self):
+        """Тест что удаление пачкой и ветки с ответами - один UPDATE счётчика"""
+        first, second = self._add_comments(2)
+        reply = Comment.objects.create(post=self.post, author=self.user, content='Reply', parent=first)
+        Comment.objects.create(post=self.post, author=self.user, content='Nested', parent=reply)
+        with CaptureQueriesContext(connection) as queries:
+            first.delete()
+        self.assertEqual(len(self._counter_updates(queries)), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self._add_comments(3)
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.filter(post=self.post).delete()
+        self.assertEqual(len(self._counter_updates(queries)), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_post_delete_skips_counter_upkeep(self):
+        """Тест что удаление статьи не обновляет её счётчик по комментарию"""
+        self._add_comments(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertEqual(self._counter_updates(queries), [])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_counter_follows_bulk_create(self):
+        """Тест bulk_create"""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, content=f'Bulk {i}')
+            for i in range(5)
+        ])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 5)
+
+    def test_bulk_create_rejects_conflict_handling(self):
+        """Пропущенные при конфликте строки не должны попадать в счётчик"""
+        with self.assertRaises(ValueError):
+            Comment.objects.bulk_create(
+                [Comment(post=self.post, author=self.user, content='Bulk')], ignore_conflicts=True
+            )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_bulk_create_rejects_replies(self):
+        """Ответ, созданный пачкой, получил бы путь корневого комментария"""
+        parent = Comment.objects.create(post=self.post, author=self.user, content='Parent')
+        with self.assertRaises(ValueError):
+            Comment.objects.bulk_create([Comment(post=self.post, author=self.user, content='Reply', parent=parent)])
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_rebuild_command_fixes_drift(self):
+        """Тест команды пересчёта счётчиков"""
+        self._add_comments(2)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=42)
+        call_command('rebuild_comment_counts', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+
 class ViewTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -170,11 +296,1425 @@ class ViewTests(TestCase):
         response = self.client.get(reverse('api_posts'))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()['results']
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['title'], self.post.title)
+        self.assertEqual(data[0]['author'], self.user.username)
+
+    def test_api_posts_legacy_view(self):
+        """Тест старого непагинированного формата API"""
+        response = self.client.get(reverse('api_posts'), {'legacy': '1'})
+        self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['title'], self.post.title)
+
+
+class ApiPostsQueryCountTests(TestCase):
+    """Проверка, что API не делает N+1 запросов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+
+    def _create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                content='Content',
+                author=self.user,
+                is_published=True
+            )
+            Comment.objects.create(post=post, author=self.user, content='Comment')
+
+    def test_api_posts_constant_query_count(self):
+        """Тест что число запросов не зависит от количества постов"""
+        self._create_posts(2)
+        # Валидаторы ETag и сама выборка
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_posts'), {'legacy': '1'})
+        self.assertEqual(len(response.json()), 2)
+
+        self._create_posts(20)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_posts'), {'legacy': '1'})
+        data = response.json()
+        self.assertEqual(len(data), 22)
+        self.assertTrue(all(item['comment_count'] == 1 for item in data))
         self.assertEqual(data[0]['author'], self.user.username)
 
+    def test_api_posts_page_constant_query_count(self):
+        """Тест что страница API строится одним запросом (плюс валидаторы)"""
+        self._create_posts(30)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_posts'), {'page_size': 10})
+        self.assertEqual(len(response.json()['results']), 10)
+
+
+class PostListQueryCountTests(TestCase):
+    """Проверка, что страницы списка не делают N+1 запросов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+
+    def _create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                content='Content',
+                author=self.user,
+                is_published=True
+            )
+            Comment.objects.create(post=post, author=self.user, content='Comment')
+
+    def test_post_list_constant_query_count(self):
+        """Тест что число запросов списка не зависит от количества постов"""
+        self._create_posts(3)
+        # COUNT для пагинатора и выборка страницы
+        with self.assertNumQueries(2):
+            self.client.get(reverse('post_list'))
+        self._create_posts(30)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('post_list'))
+        self.assertContains(response, '1 комментариев')
+
+    def test_home_constant_query_count(self):
+        """Тест что главная страница строится одним запросом"""
+        self._create_posts(10)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, self.user.username)
+
+    def test_post_list_pagination(self):
+        """Тест постраничной навигации списка статей"""
+        self._create_posts(5)
+        with self.settings(BLOG_POSTS_PER_PAGE=2):
+            response = self.client.get(reverse('post_list'), {'page': 3})
+        self.assertEqual(len(response.context['posts']), 1)
+        self.assertContains(response, 'Post 0')
+        self.assertContains(response, '3 из 3')
+
+
+class FragmentCacheTests(TestCase):
+    """Проверка кэша фрагментов и его сброса сигналами"""
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.post = Post.objects.create(
+            title='Cached Post',
+            content='Original content',
+            author=self.user,
+            is_published=True
+        )
+        self.url = reverse('post_detail', args=[self.post.pk])
+
+    def test_second_render_hits_cache(self):
+        """Тест попадания в кэш при повторном рендере"""
+        self.client.get(self.url)
+        self.assertEqual(fragment_stats(), {'hits': 0, 'misses': 2})
+        self.client.get(self.url)
+        self.assertEqual(fragment_stats(), {'hits': 2, 'misses': 2})
+
+    def test_version_bumped_again_after_commit(self):
+        """Фрагмент, сохранённый до коммита записи, после коммита не читается"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.content = 'Edited content'
+            self.post.save()
+            version = get_version(post_scope(self.post.pk))
+        self.assertNotEqual(get_version(post_scope(self.post.pk)), version)
+
+    def test_post_edit_invalidates_body(self):
+        """Тест сброса фрагментов при изменении статьи"""
+        self.client.get(self.url)
+        self.post.content = 'Edited content'
+        self.post.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Edited content')
+        self.assertNotContains(response, 'Original content')
+
+    def test_new_comment_invalidates_list_and_card(self):
+        """Тест сброса фрагментов при добавлении комментария"""
+        self.client.get(self.url)
+        self.client.get(reverse('post_list'))
+        Comment.objects.create(post=self.post, author=self.user, content='Fresh comment')
+        self.assertContains(self.client.get(self.url), 'Fresh comment')
+        self.assertContains(self.client.get(reverse('post_list')), '1 комментариев')
+
+
+@override_settings(BLOG_PAGE_CACHE=True)
+class AnonymousPageCacheTests(TestCase):
+    """Проверка кэша целых страниц для анонимных посетителей"""
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.post = Post.objects.create(
+            title='Cached Post',
+            content='Content',
+            author=self.user,
+            is_published=True
+        )
+        self.other = Post.objects.create(
+            title='Other Post',
+            content='Content',
+            author=self.user,
+            is_published=True
+        )
+
+    def test_anonymous_get_served_from_cache(self):
+        """Тест что повторный анонимный запрос не идёт в БД"""
+        url = reverse('post_detail', args=[self.post.pk])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Cached Post')
+        self.assertEqual(page_stats(), {'hits': 1, 'misses': 1})
+
+    def test_cached_page_answers_not_modified(self):
+        """Тест 304 для страницы из кэша по её сохранённому ETag"""
+        url = reverse('post_detail', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_authenticated_user_bypasses_cache(self):
+        """Тест что авторизованные пользователи не используют кэш"""
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(reverse('post_list'))
+        self.client.get(reverse('post_list'))
+        self.assertEqual(page_stats(), {'hits': 0, 'misses': 0})
+
+    def test_comment_purges_its_post_and_lists(self):
+        """Тест сброса страницы статьи и списков (счётчик в карточках) при комментарии"""
+        url = reverse('post_detail', args=[self.post.pk])
+        other_url = reverse('post_detail', args=[self.other.pk])
+        self.client.get(url)
+        self.client.get(other_url)
+        self.assertContains(self.client.get(reverse('post_list')), '0 комментариев', count=2)
+        comment = Comment.objects.create(post=self.post, author=self.user, content='Fresh comment')
+        self.assertContains(self.client.get(url), 'Fresh comment')
+        self.assertContains(self.client.get(reverse('post_list')), '1 комментариев')
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+        comment.delete()
+        self.assertContains(self.client.get(reverse('post_list')), '0 комментариев', count=2)
+
+    def test_publishing_purges_lists(self):
+        """Тест сброса списков при публикации статьи"""
+        draft = Post.objects.create(title='Draft', content='Content', author=self.user)
+        self.client.get(reverse('home'))
+        self.client.get(reverse('post_detail', args=[self.post.pk]))
+        draft.is_published = True
+        draft.save()
+        self.assertContains(self.client.get(reverse('home')), 'Draft')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('post_detail', args=[self.post.pk]))
+
+
+class ConditionalGetTests(TestCase):
+    """Проверка ответов 304 по ETag"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.post = Post.objects.create(
+            title='Test Post',
+            content='This is a test post content',
+            author=self.user,
+            is_published=True
+        )
+        self.url = reverse('post_detail', args=[self.post.pk])
+
+    def test_post_detail_not_modified(self):
+        """Тест 304 для неизменившейся статьи без рендера"""
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_no_last_modified_after_removals(self):
+        """Тест что удаления не подтверждаются 304 по If-Modified-Since"""
+        comment = Comment.objects.create(post=self.post, author=self.user, content='Removed comment')
+        removed = Post.objects.create(title='Removed', content='Body', author=self.user, is_published=True)
+        self.assertFalse(self.client.get(self.url).has_header('Last-Modified'))
+        self.assertFalse(self.client.get(reverse('api_posts')).has_header('Last-Modified'))
+        since = http_date(time.time() + 60)
+        comment.delete()
+        removed.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_posts'), HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_post_detail_comment_changes_etag(self):
+        """Тест что новый комментарий меняет ETag"""
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(post=self.post, author=self.user, content='New comment')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'New comment')
+
+    def test_post_detail_etag_depends_on_user(self):
+        """Тест что анонимный ETag не подходит авторизованному пользователю"""
+        etag = self.client.get(self.url)['ETag']
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_etag_changes_on_relogin(self):
+        """Тест что после повторного входа страница с прежним CSRF-токеном не подтверждается"""
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.logout()
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_posts_not_modified(self):
+        """Тест 304 для API без сериализации"""
+        etag = self.client.get(reverse('api_posts'))['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_posts'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user, content='New comment')
+        response = self.client.get(reverse('api_posts'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ConnectionPoolStatsTests(TestCase):
+    """Проверка метрик пула соединений"""
+
+    def test_no_pool_on_sqlite(self):
+        """Тест что без пула статистика пуста"""
+        self.assertEqual(pool_stats(), {})
+
+    def test_saturation_is_logged_and_exported(self):
+        """Тест предупреждения и метрик при исчерпании пула"""
+        fake_pool = mock.Mock()
+        fake_pool.get_stats.return_value = {
+            'pool_size': 10, 'pool_available': 0, 'requests_waiting': 3,
+        }
+        with mock.patch.object(connections['default'], 'pool', fake_pool, create=True):
+            self.assertEqual(pool_stats()['default']['requests_waiting'], 3)
+            with self.assertLogs('blog.db', level='WARNING') as logs:
+                self.client.get(reverse('api_posts'))
+        self.assertIn('ожидают 3', logs.output[0])
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('blog_db_pool_size{alias="default"} 10.0', metrics)
+        self.assertIn('blog_db_pool_available{alias="default"} 0.0', metrics)
+        self.assertIn('blog_db_pool_requests_waiting{alias="default"} 3.0', metrics)
+
+
+class AsyncViewTests(TestCase):
+    """Проверка асинхронных view через ASGI-обработчик"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.post = Post.objects.create(
+            title='Async Post',
+            content='This is a test post content',
+            author=self.user,
+            is_published=True
+        )
+
+    async def test_read_views_under_asgi(self):
+        """Тест главной, списка, статьи и API через AsyncClient"""
+        for url in (reverse('home'), reverse('post_list'), reverse('post_detail', args=[self.post.pk])):
+            response = await self.async_client.get(url)
+            self.assertContains(response, 'Async Post')
+        response = await self.async_client.get(reverse('api_posts'))
+        self.assertEqual(response.json()['results'][0]['title'], 'Async Post')
+
+    async def test_add_comment_under_asgi(self):
+        """Тест добавления комментария через AsyncClient"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('post_detail', args=[self.post.pk]), {'content': 'Async comment'}
+        )
+        self.assertEqual(response.status_code, 302)
+        await self.post.arefresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+
+class IndexUsageTests(TestCase):
+    """Проверка через EXPLAIN, что горячие запросы идут по индексам"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        for i in range(20):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                content='Content',
+                author=self.user,
+                is_published=i % 2 == 0
+            )
+            Comment.objects.create(post=post, author=self.user, content='Comment')
+        if connection.vendor == 'postgresql':
+            # На крошечных таблицах планировщик предпочёл бы seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('EXPLAIN проверяется только для SQLite и PostgreSQL')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_published_posts_use_partial_index(self):
+        """Тест индекса для списка опубликованных статей"""
+        queryset = Post.objects.filter(is_published=True).order_by('-created_at', '-id')[:10]
+        self.assertUsesIndex(queryset, 'blog_post_published_idx')
+
+    def test_author_posts_use_index(self):
+        """Тест индекса для статей автора"""
+        queryset = Post.objects.filter(author=self.user).order_by('-created_at')
+        self.assertUsesIndex(queryset, 'blog_post_author_created_idx')
+
+    def test_post_comments_use_index(self):
+        """Тест индекса для комментариев статьи"""
+        post = Post.objects.first()
+        self.assertUsesIndex(post.comments.all(), 'blog_comment_post_created_idx')
+
+
+class ApiPostsPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        now = timezone.now()
+        # Часть постов с одинаковым created_at, чтобы проверить разрешение по id
+        self.posts = [
+            Post.objects.create(
+                title=f'Post {i}',
+                content='Content',
+                author=self.user,
+                is_published=True,
+                created_at=now - timedelta(minutes=i // 2)
+            )
+            for i in range(7)
+        ]
+
+    def _get(self, **params):
+        response = self.client.get(reverse('api_posts'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_forward_and_back(self):
+        """Тест обхода страниц вперёд и назад по курсорам"""
+        seen = []
+        page = self._get(page_size=3)
+        self.assertIsNone(page['previous'])
+        pages = [page]
+        while page['next']:
+            page = self._get(page_size=3, cursor=page['next'])
+            pages.append(page)
+        for page in pages:
+            seen.extend(item['id'] for item in page['results'])
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+        previous = self._get(page_size=3, cursor=pages[-1]['previous'])
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_pages_stable_when_posts_inserted(self):
+        """Тест что новые посты не сдвигают следующую страницу"""
+        first = self._get(page_size=3)
+        Post.objects.create(title='Fresh', content='Content', author=self.user, is_published=True)
+        second = self._get(page_size=3, cursor=first['next'])
+        first_ids = {item['id'] for item in first['results']}
+        self.assertFalse(first_ids & {item['id'] for item in second['results']})
+        self.assertEqual(len(second['results']), 3)
+
+    def test_page_size_is_capped(self):
+        """Тест ограничения page_size максимумом из настроек"""
+        with self.settings(BLOG_API_MAX_PAGE_SIZE=2):
+            page = self._get(page_size=1000)
+        self.assertEqual(len(page['results']), 2)
+
+    def test_invalid_cursor(self):
+        """Тест ответа 400 на подделанный курсор"""
+        response = self.client.get(reverse('api_posts'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск (индекс поддерживается триггерами СУБД)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='testpass123')
+        self.post = Post.objects.create(
+            title='Асинхронные представления',
+            content='Django умеет обслуживать запросы через ASGI <script>',
+            author=self.user,
+            is_published=True,
+        )
+        self.draft = Post.objects.create(
+            title='Черновик про ASGI',
+            content='Ещё не опубликовано',
+            author=self.user,
+            is_published=False,
+        )
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.user, content='Отличная статья про uvicorn'
+        )
+
+    def test_post_migrate_restores_only_missing_triggers(self):
+        from .search import ensure_search_triggers
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('Триггеры FTS5 теряются только в SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER blog_post_fts_insert")
+        # Проверка установки, список триггеров и один CREATE TRIGGER - без переиндексации
+        with self.assertNumQueries(3):
+            ensure_search_triggers(connection)
+        with self.assertNumQueries(2):
+            ensure_search_triggers(connection)
+        Post.objects.create(title='Про триггеры', content='Текст', author=self.user, is_published=True)
+        self.assertEqual([post['title'] for post in search_posts('триггеры')], ['Про триггеры'])
+
+    def test_finds_published_posts_only(self):
+        response = self.client.get(reverse('api_search'), {'q': 'ASGI'})
+        data = response.json()
+        self.assertEqual([post['id'] for post in data['posts']], [self.post.pk])
+
+    def test_prefix_and_highlight(self):
+        response = self.client.get(reverse('search'), {'q': 'обслуж'})
+        self.assertContains(response, 'Асинхронные представления')
+        self.assertContains(response, '<mark>обслуживать</mark>')
+        # Текст статьи экранируется, подсветка - нет
+        self.assertNotContains(response, '<script>')
+
+    def test_comment_search(self):
+        data = self.client.get(reverse('api_search'), {'q': 'uvicorn'}).json()
+        self.assertEqual(data['comments'][0]['id'], self.comment.pk)
+        self.assertEqual(data['comments'][0]['post_id'], self.post.pk)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.content = 'Теперь про пулы соединений'
+        self.post.save()
+        self.comment.delete()
+        data = self.client.get(reverse('api_search'), {'q': 'uvicorn'}).json()
+        self.assertEqual(data['comments'], [])
+        data = self.client.get(reverse('api_search'), {'q': 'пулы'}).json()
+        self.assertEqual([post['id'] for post in data['posts']], [self.post.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.client.get(reverse('api_search'), {'q': '"ASGI* OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_empty_query(self):
+        data = self.client.get(reverse('api_search')).json()
+        self.assertEqual(data, {'query': '', 'posts': [], 'comments': []})
+
+
+class BenchmarkSuiteTests(TestCase):
+    """Смоук-тест нагрузочного набора на крошечных данных"""
+
+    def test_seed_and_run_cases(self):
+        user, post = benchmarks.seed(users=3, posts=10, comments=30)
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertEqual(post.comment_count, Comment.objects.filter(post=post).count())
+        for case in benchmarks.CASES:
+            result = benchmarks.run_case(case, post, user, iterations=3, warmup=1)
+            self.assertEqual(result['requests'], 3)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_kib'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_summarize_percentiles(self):
+        stats = benchmarks.summarize([i / 1000 for i in range(1, 101)], elapsed=2)
+        self.assertEqual(stats['rps'], 50)
+        self.assertEqual(stats['p50_ms'], 51)
+        self.assertEqual(stats['p99_ms'], 99)
+
+
+class SeedBlogCommandTests(TestCase):
+    def test_seed_creates_consistent_data(self):
+        user = User.objects.create_user(username='existing', password='testpass123')
+        Post.objects.create(title='Существующая', content='Уникальноеслово', author=user, is_published=True)
+        call_command(
+            'seed_blog', users=3, posts=40, comments_per_post=3, hot_ratio=0.05,
+            hot_comments=50, batch_size=7, chunk_size=15, seed=1, stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 41)
+        self.assertTrue(Comment.objects.exists())
+        # Счётчики совпадают с реальным числом комментариев
+        out = StringIO()
+        call_command('rebuild_comment_counts', dry_run=True, stdout=out)
+        self.assertIn('неверным счётчиком: 0', out.getvalue())
+        self.assertFalse(Comment.objects.filter(created_at__lt=F('post__created_at')).exists())
+        # Новые строки проиндексированы, старые - ровно один раз, триггеры включены
+        word = Post.objects.filter(is_published=True).last().content.split()[1].strip('.,!?')
+        self.assertTrue(search_posts(word))
+        self.assertEqual(len(search_posts('Уникальноеслово')), 1)
+        Post.objects.create(title='После загрузки', content='Свежийтекст', author=user, is_published=True)
+        self.assertEqual(len(search_posts('Свежийтекст')), 1)
+
+
+@override_settings(BLOG_PROFILING_SAMPLE_RATE=1.0, BLOG_SLOW_REQUEST_MS=10_000)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='profiled', password='testpass123')
+        self.post = Post.objects.create(
+            title='Profiled', content='Body', author=self.user, is_published=True
+        )
+
+    def test_server_timing_header(self):
+        with self.assertLogs('blog.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        timing = response.headers['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('template;dur=', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'post_detail')
+        self.assertEqual(record['queries'], 3)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_duplicate_queries_counted(self):
+        for i in range(3):
+            Post.objects.create(title=f'P{i}', content='x', author=self.user, is_published=True)
+        profiling.install()
+        profiling._instrument_connection(connection=connection)
+        profile = profiling.RequestProfile()
+        token = profiling._current.set(profile)
+        try:
+            # N+1: автор каждой статьи читается отдельным запросом
+            for post in Post.objects.all():
+                post.author.username
+        finally:
+            profiling._current.reset(token)
+        self.assertEqual(profile.queries, 5)
+        self.assertEqual(profile.duplicate_queries, 3)
+
+    @override_settings(BLOG_SLOW_REQUEST_MS=0)
+    def test_slow_request_logs_sql(self):
+        with self.assertLogs('blog.profiling', 'WARNING') as logs:
+            self.client.get(reverse('api_posts'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['sql'])
+        self.assertIn('blog_post', record['sql'][0]['sql'])
+
+    @override_settings(BLOG_PROFILING_SAMPLE_RATE=0)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('Server-Timing', response.headers)
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='metrics', password='testpass123')
+        Post.objects.create(title='Metrics', content='Body', author=self.user, is_published=True)
+
+    def test_exports_request_db_and_cache_metrics(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('blog_http_request_duration_seconds_bucket{le="0.005",method="GET",view="home"}', body)
+        self.assertIn('blog_http_requests_total{method="GET",status="200",view="home"}', body)
+        self.assertIn('blog_http_requests_in_flight', body)
+        self.assertIn('blog_http_request_db_queries_count{view="home"}', body)
+        self.assertIn('blog_db_queries_total{alias="default"}', body)
+        self.assertIn('blog_cache_requests_total{cache="fragment",result="miss"}', body)
+        self.assertIn('blog_workers 1.0', body)
+
+
+class PrecompiledTemplateLoaderTests(TestCase):
+    def test_extends_is_bound_to_compiled_parent(self):
+        engine = engines['django']
+        self.assertEqual(precompile_templates(), len(template_names()))
+        template = engine.get_template('blog/post_list.html').template
+        extends = template.nodelist.get_nodes_by_type(ExtendsNode)[0]
+        self.assertIsInstance(extends.parent_name, ResolvedParent)
+        self.assertIs(extends.parent_name.template, engine.get_template('blog/base.html').template)
+        html = render_to_string('blog/post_list.html', {'posts': []})
+        self.assertIn('Статей пока нет', html)
+        self.assertIn('<nav class="navbar', html)
+
+    def test_template_benchmark_reports_variants(self):
+        results = benchmarks.run_template_benchmark(cards=5, iterations=2)
+        self.assertEqual([r['variant'] for r in results], ['uncached', 'cached', 'precompiled'])
+        self.assertEqual(results[0]['saving_pct'], 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.first = Post.objects.create(title='First', content='A', author=self.staff, is_published=True)
+        self.draft = Post.objects.create(title='Draft', content='B', author=self.staff)
+        self.third = Post.objects.create(title='Third', content='C', author=self.staff, is_published=True)
+        for post, count in ((self.first, 2), (self.draft, 1), (self.third, 3)):
+            for i in range(count):
+                Comment.objects.create(post=post, author=self.staff, content=f'{post.title} {i}')
+
+    def _export(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_posts'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_nests_comments_under_their_posts(self):
+        lines = [json.loads(line) for line in self._export().splitlines()]
+        self.assertEqual([post['title'] for post in lines], ['First', 'Draft', 'Third'])
+        for post in lines:
+            self.assertEqual(len(post['comments']), post['comment_count'])
+            self.assertTrue(all(c['content'].startswith(post['title']) for c in post['comments']))
+
+    def test_json_array_published_only(self):
+        data = json.loads(self._export(format='json', published='1'))
+        self.assertEqual([post['id'] for post in data], [self.first.pk, self.third.pk])
+        self.assertEqual(len(data[1]['comments']), 3)
+
+    def test_empty_export_is_valid_json(self):
+        Post.objects.all().delete()
+        self.assertEqual(json.loads(self._export(format='json')), [])
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('export_posts'))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_staff_only(self):
+        response = self.client.get(reverse('export_posts'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_command_small_chunks(self):
+        out = StringIO()
+        call_command('export_blog', chunk_size=1, stdout=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sum(len(post['comments']) for post in lines), 6)
+
+
+# Задачи идут через очередь и воркер, даже если тесты запущены с DEBUG=1
+@override_settings(BLOG_TASKS_EAGER=False)
+class ImportTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        feed_dir = override_settings(BLOG_FEED_DIR=os.path.join(self.tmpdir, 'feeds'))
+        feed_dir.enable()
+        self.addCleanup(feed_dir.disable)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        return path
+
+    def _ndjson(self, count, comments=2):
+        return ''.join(json.dumps({
+            'title': f'Imported {i}',
+            'content': 'Body',
+            'author': 'author',
+            'created_at': '2024-01-02T03:04:05+00:00',
+            'is_published': True,
+            'comments': [{'author': 'author', 'content': f'c{j}'} for j in range(comments)],
+        }) + '\n' for i in range(count))
+
+    def test_round_trip_with_export(self):
+        post = Post.objects.create(title='Original', content='Text', author=self.author, is_published=True)
+        Comment.objects.create(post=post, author=self.admin, content='Hi')
+        out = StringIO()
+        call_command('export_blog', stdout=out)
+        Post.objects.all().delete()
+        path = self._write('dump.ndjson', out.getvalue())
+        call_command('import_blog', path, stdout=StringIO())
+        imported = Post.objects.get()
+        self.assertEqual((imported.title, imported.author, imported.comment_count), ('Original', self.author, 1))
+        self.assertEqual(imported.comments.get().author, self.admin)
+
+    def test_round_trip_keeps_reply_threads(self):
+        """Ответы после выгрузки и импорта остаются в своих ветках"""
+        post = Post.objects.create(title='Thread', content='Text', author=self.author, is_published=True)
+        root = Comment.objects.create(post=post, author=self.admin, content='root')
+        reply = Comment.objects.create(post=post, author=self.author, content='reply', parent=root)
+        Comment.objects.create(post=post, author=self.admin, content='nested', parent=reply)
+        # Ответ раньше родителя по времени: в файле он окажется первым
+        Comment.objects.filter(pk=reply.pk).update(created_at=root.created_at - timedelta(minutes=1))
+        out = StringIO()
+        call_command('export_blog', stdout=out)
+        Post.objects.all().delete()
+        call_command('import_blog', self._write('dump.ndjson', out.getvalue()), stdout=StringIO())
+        comments = {c.content: c for c in Comment.objects.all()}
+        self.assertIsNone(comments['root'].parent_id)
+        self.assertEqual(comments['reply'].parent_id, comments['root'].pk)
+        self.assertEqual(comments['nested'].parent_id, comments['reply'].pk)
+        self.assertEqual([comments[name].depth for name in ('root', 'reply', 'nested')], [0, 1, 2])
+        self.assertEqual(comments['nested'].path, comments['reply'].path + f"{comments['nested'].pk:010d}")
+        self.assertEqual(Comment.objects.subtree(comments['root']).count(), 3)
+
+    def test_reply_cycle_is_rejected(self):
+        """Комментарии, отвечающие друг другу по кругу, отклоняются"""
+        record = {'title': 'Loop', 'content': 'Body', 'author': 'author', 'comments': [
+            {'id': 1, 'parent': 2, 'author': 'author', 'content': 'a'},
+            {'id': 2, 'parent': 1, 'author': 'author', 'content': 'b'},
+        ]}
+        path = self._write('loop.ndjson', json.dumps(record) + '\n')
+        call_command('import_blog', path, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Post.objects.filter(title='Loop').exists())
+        self.assertIn('цикл', ImportJob.objects.get().last_error)
+
+    def test_import_refreshes_existing_feeds(self):
+        Post.objects.create(title='Old', content='Text', author=self.author, is_published=True)
+        self.client.get(reverse('feed', args=['rss']))
+        self.client.get(reverse('author_feed', args=['author', 'rss']))
+        path = self._write('posts.ndjson', self._ndjson(2, comments=0))
+        call_command('import_blog', path, stdout=StringIO())
+        refresh = Task.objects.get(name=feeds.refresh_feeds.task_name)
+        self.assertEqual(refresh.kwargs, {'author_ids': [self.author.pk]})
+        call_command('run_tasks', once=True, concurrency=1, stdout=StringIO())
+        self.assertIn('Imported 1', feeds.feed_file('rss').read_text(encoding='utf-8'))
+        self.assertIn('Imported 1', feeds.feed_file('rss', self.author.pk).read_text(encoding='utf-8'))
+
+    def test_csv_rows_are_validated(self):
+        path = self._write('posts.csv', (
+            'title,content,author,created_at,is_published\n'
+            'Good,Text,author,2024-05-01T10:00:00,да\n'
+            ',No title,author,,\n'
+            'Bad date,Text,author,yesterday,\n'
+            'Ghost,Text,ghost,,1\n'
+        ))
+        err = StringIO()
+        call_command('import_blog', path, stdout=StringIO(), stderr=err)
+        post = Post.objects.get()
+        self.assertTrue(post.is_published)
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.rows_done, job.rows_rejected), (ImportJob.DONE, 4, 3))
+        self.assertIn("автор 'ghost' не найден", err.getvalue())
+
+        call_command('import_blog', self._write('more.csv', 'title,content,author\nNew,Text,ghost\n'),
+                     create_authors=True, stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='ghost', post__title='New').exists())
+
+    def test_resume_after_failure_does_not_duplicate(self):
+        path = self._write('big.ndjson', self._ndjson(7))
+        original = importer._insert
+        calls = []
+
+        def failing_insert(rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise OSError('диск отвалился')
+            return original(rows)
+
+        with mock.patch.object(importer, '_insert', failing_insert):
+            with self.assertRaises(CommandError):
+                call_command('import_blog', path, batch_size=3, stdout=StringIO())
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.rows_done), (ImportJob.FAILED, 3))
+        self.assertEqual(Post.objects.count(), 3)
+
+        call_command('import_blog', path, batch_size=3, resume=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.posts_created), (ImportJob.DONE, 7, 7))
+        self.assertEqual(Post.objects.count(), 7)
+        self.assertEqual(Comment.objects.count(), 14)
+
+    def test_admin_upload(self):
+        self.client.force_login(self.admin)
+        upload = SimpleUploadedFile('posts.ndjson', self._ndjson(2).encode())
+        with override_settings(BLOG_IMPORT_DIR=self.tmpdir):
+            response = self.client.post(reverse('admin:blog_post_import'), {'file': upload})
+        self.assertRedirects(response, reverse('admin:blog_importjob_changelist'))
+        # Импорт выполняет воркер задач, а не запрос
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.PENDING)
+        self.assertEqual(Post.objects.count(), 0)
+        call_command('run_tasks', once=True, concurrency=1, stdout=StringIO())
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.DONE)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertContains(self.client.get(reverse('admin:blog_post_changelist')), 'Импорт из файла')
+
+    def test_running_job_is_not_resumed_twice(self):
+        path = self._write('live.ndjson', self._ndjson(3))
+        job = ImportJob.objects.create(source=path, format='ndjson', status=ImportJob.RUNNING)
+        with self.assertRaisesMessage(CommandError, 'уже выполняется'):
+            call_command('import_blog', path, resume=True, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 0)
+        # Брошенный упавшим процессом импорт продолжается
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - importer.STALE_AFTER * 2)
+        call_command('import_blog', path, resume=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.posts_created), (ImportJob.DONE, 3))
+
+
+class ReplicaRoutingTests(TestCase):
+    """Проверка чтения с реплик и возврата к основной БД после записи"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(title='Replica', content='Body', author=self.user, is_published=True)
+
+    def _age_version(self, scope):
+        cache.set(f'blog:version:{scope}', time.time_ns() - 60 * 10**9, None)
+
+    @override_settings(BLOG_DB_REPLICAS=['replica1'])
+    def test_router(self):
+        """Тест выбора БД роутером в запросе и вне его"""
+        router = routers.ReplicaRouter()
+        # Вне запроса (команды, фоновые задачи) - всегда основная БД
+        self.assertIsNone(router.db_for_read(Post))
+        state = routers.RoutingState(use_replica=True)
+        token = routers._state.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica1')
+            self.assertEqual(router.db_for_write(Comment), 'default')
+            self.assertTrue(state.wrote)
+            self.assertIsNone(router.db_for_read(Post))
+        finally:
+            routers._state.reset(token)
+        self.assertFalse(router.allow_migrate('replica1', 'blog'))
+        self.assertTrue(router.allow_migrate('default', 'blog'))
+
+    # Вместо реплики - тот же default, чтобы запросы реально выполнялись
+    @override_settings(BLOG_DB_REPLICAS=['default'])
+    def test_sticky_after_comment(self):
+        """Тест что автор комментария следующим запросом читает из основной БД"""
+        self.client.force_login(self.user)
+        url = reverse('post_detail', args=[self.post.pk])
+        with mock.patch('blog.routers.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+            response = self.client.get(url)
+            self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+            self.assertTrue(choice.called)
+
+            response = self.client.post(url, {'content': 'Мой комментарий'})
+            self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+            choice.reset_mock()
+            response = self.client.get(url)
+            self.assertContains(response, 'Мой комментарий')
+            self.assertFalse(choice.called)
+
+    @override_settings(BLOG_DB_REPLICAS=['default'])
+    def test_replica_fragments_not_cached_right_after_write(self):
+        """Тест что фрагменты с реплики не кэшируются сразу после смены версии"""
+        cache.clear()
+        reset_stats()
+        url = reverse('post_detail', args=[self.post.pk])
+        with mock.patch('blog.routers.random.choice', side_effect=lambda aliases: aliases[0]):
+            self.client.get(url)
+            self.client.get(url)
+            # Реплика могла не догнать запись, сменившую версию
+            self.assertEqual(fragment_stats()['hits'], 0)
+            self._age_version(post_scope(self.post.pk))
+            self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(fragment_stats()['hits'], 2)
+
+    @override_settings(BLOG_DB_REPLICAS=['default'], BLOG_PAGE_CACHE=True)
+    def test_page_cache_miss_after_write_reads_primary(self):
+        """Тест что страница для кэша после смены версии собирается по основной БД"""
+        cache.clear()
+        url = reverse('post_detail', args=[self.post.pk])
+        with mock.patch('blog.routers.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+            self.client.get(url)
+            self.assertFalse(choice.called)
+            self._age_version(post_scope(self.post.pk))
+            self.client.get(url)
+            self.assertTrue(choice.called)
+
+
+class SessionStorageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sessions', password='testpass123')
+
+    def _session(self, key, expire_date):
+        return Session(session_key=key, session_data='', expire_date=expire_date)
+
+    def test_prune_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [self._session(f'old{i}', now - timedelta(days=1)) for i in range(7)]
+            + [self._session('alive', now + timedelta(days=1))]
+        )
+        out = StringIO()
+        call_command('prune_sessions', batch_size=3, stdout=out)
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), ['alive'])
+        self.assertIn('Удалено 3', out.getvalue())
+        self.assertIn('удалены: 7', out.getvalue())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions_skip_database(self):
+        post = Post.objects.create(title='Signed', content='Body', author=self.user, is_published=True)
+        self.client.force_login(self.user)
+        self.assertFalse(Session.objects.exists())
+        response = self.client.post(
+            reverse('post_detail', args=[post.pk]), {'content': 'Через подписанную cookie'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.get().author, self.user)
+        self.assertFalse(Session.objects.exists())
+        out = StringIO()
+        call_command('prune_sessions', stdout=out)
+        self.assertIn('удалять нечего', out.getvalue())
+
+    def test_benchmark_session_modes(self):
+        post = Post.objects.create(title='Bench', content='Body', author=self.user, is_published=True)
+        case = next(case for case in benchmarks.CASES if case.name == 'my_posts')
+        results = {
+            result['session']: result
+            for result in benchmarks.run_session_modes(
+                [case], post, self.user, ['db', 'cached_db', 'signed_cookies'], iterations=2
+            )
+        }
+        self.assertEqual(set(results), {'db', 'cached_db', 'signed_cookies'})
+        # Без чтения сессии из БД на запрос меньше
+        self.assertLess(results['signed_cookies']['queries'], results['db']['queries'])
+        self.assertLess(results['cached_db']['queries'], results['db']['queries'])
+
+
+class ThreadedCommentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='threads', password='testpass123')
+        self.post = Post.objects.create(title='Threads', content='Body', author=self.user, is_published=True)
+
+    def _comment(self, content, parent=None, post=None):
+        return Comment.objects.create(
+            post=post or self.post, author=self.user, content=content, parent=parent
+        )
+
+    def test_subtree_in_thread_order(self):
+        first = self._comment('first')
+        second = self._comment('second')
+        reply = self._comment('reply', parent=first)
+        nested = self._comment('nested', parent=reply)
+        late_reply = self._comment('late reply', parent=first)
+        self.assertEqual((reply.depth, nested.depth), (1, 2))
+        self.assertTrue(nested.path.startswith(reply.path))
+        ordered = list(Comment.objects.filter(post=self.post).order_by('path').values_list('content', flat=True))
+        self.assertEqual(ordered, ['first', 'reply', 'nested', 'late reply', 'second'])
+        with self.assertNumQueries(1):
+            subtree = [c.pk for c in Comment.objects.subtree(first).order_by('path')]
+        self.assertEqual(subtree, [first.pk, reply.pk, nested.pk, late_reply.pk])
+        self.assertEqual([c.pk for c in Comment.objects.subtree(second)], [second.pk])
+
+    def test_depth_is_capped(self):
+        parent = None
+        with mock.patch('blog.models.MAX_DEPTH', 3):
+            for i in range(5):
+                parent = self._comment(f'level {i}', parent=parent)
+        self.assertEqual(parent.depth, 2)
+        self.assertEqual(len(parent.path), 3 * 10)
+
+    def test_bulk_created_comments_get_paths(self):
+        Comment.objects.bulk_create([Comment(post=self.post, author=self.user, content=str(i)) for i in range(3)])
+        self.assertFalse(Comment.objects.filter(path='').exists())
+        for comment in Comment.objects.all():
+            self.assertEqual(comment.path, str(comment.pk).zfill(10))
+
+    def test_admin_cannot_move_existing_comment(self):
+        first = self._comment('first')
+        reply = self._comment('reply')
+        admin_user = User.objects.create_superuser(username='threads-admin', password='testpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:blog_comment_change', args=[reply.pk])
+        self.assertNotContains(self.client.get(url), 'name="parent"')
+        self.client.post(url, {
+            'post': self.post.pk, 'author': self.user.pk, 'content': 'edited', 'parent': first.pk,
+            'created_at_0': '2024-01-01', 'created_at_1': '00:00:00',
+        })
+        reply.refresh_from_db()
+        self.assertEqual((reply.content, reply.parent_id, reply.depth), ('edited', None, 0))
+        self.assertContains(self.client.get(reverse('admin:blog_comment_add')), 'name="parent"')
+
+    def test_reply_via_form(self):
+        parent = self._comment('parent')
+        self.client.force_login(self.user)
+        url = reverse('post_detail', args=[self.post.pk])
+        self.assertContains(self.client.get(url, {'reply': parent.pk}), 'name="parent"')
+        response = self.client.post(url, {'content': 'answer', 'parent': parent.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.get(content='answer').parent, parent)
+        # Комментарий другой статьи не может быть родителем
+        other = Post.objects.create(title='Other', content='Body', author=self.user, is_published=True)
+        foreign = self._comment('foreign', post=other)
+        self.client.post(url, {'content': 'orphan', 'parent': foreign.pk})
+        self.assertIsNone(Comment.objects.get(content='orphan').parent)
+
+    @override_settings(BLOG_COMMENTS_PER_PAGE=2)
+    def test_comment_pages_by_cursor(self):
+        root = self._comment('c0')
+        self._comment('c1', parent=root)
+        self._comment('c2')
+        url = reverse('post_detail', args=[self.post.pk])
+        response = self.client.get(url)
+        self.assertEqual([c.content for c in response.context['page'].comments], ['c0', 'c1'])
+        cursor = response.context['page'].next_cursor
+        self.assertContains(response, f'?after={cursor}')
+        response = self.client.get(url, {'after': cursor})
+        self.assertEqual([c.content for c in response.context['page'].comments], ['c2'])
+        self.assertIsNone(response.context['page'].next_cursor)
+        # Некорректный курсор - первая страница
+        response = self.client.get(url, {'after': 'x'})
+        self.assertEqual(response.context['page'].comments[0].content, 'c0')
+
+    def test_first_page_is_bounded(self):
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.user, content=str(i)) for i in range(200)]
+        )
+        with override_settings(BLOG_COMMENTS_PER_PAGE=20):
+            response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertEqual(len(response.context['page'].comments), 20)
+        self.assertNotContains(response, '<p>25</p>')
+
+    def test_thread_view(self):
+        root = self._comment('root')
+        self._comment('inside', parent=root)
+        self._comment('outside')
+        response = self.client.get(reverse('comment_thread', args=[self.post.pk, root.pk]))
+        self.assertContains(response, 'inside')
+        self.assertNotContains(response, 'outside')
+        other = Post.objects.create(title='Other', content='Body', author=self.user, is_published=True)
+        response = self.client.get(reverse('comment_thread', args=[other.pk, root.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_deleting_comment_removes_replies(self):
+        root = self._comment('root')
+        self._comment('reply', parent=root)
+        root.delete()
+        self.assertFalse(Comment.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+
+class CommentApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='api', password='testpass123')
+        self.post = Post.objects.create(title='Api', content='Body', author=self.user, is_published=True)
+        self.url = reverse('api_post_comments', args=[self.post.pk])
+
+    def test_pages_follow_cursor_with_authors_joined(self):
+        root = Comment.objects.create(post=self.post, author=self.user, content='root')
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.user, content=f'c{i}') for i in range(4)]
+        )
+        reply = Comment.objects.create(post=self.post, author=self.user, content='reply', parent=root)
+        # Проверка ETag + страница с авторами через JOIN, без запроса на комментарий
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url, {'page_size': 3}).json()
+        self.assertEqual([c['content'] for c in data['results']], ['root', 'reply', 'c0'])
+        self.assertEqual(data['results'][1]['parent'], root.pk)
+        self.assertEqual(data['results'][1]['depth'], 1)
+        self.assertEqual(data['results'][0]['author'], 'api')
+        seen = [c['id'] for c in data['results']]
+        while data['next']:
+            data = self.client.get(self.url, {'page_size': 3, 'after': data['next']}).json()
+            seen += [c['id'] for c in data['results']]
+        self.assertEqual(len(seen), 6)
+        self.assertIn(reply.pk, seen)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {'after': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'page_size': 'x'}).status_code, 400)
+        draft = Post.objects.create(title='Draft', content='Body', author=self.user)
+        Comment.objects.create(post=draft, author=self.user, content='hidden')
+        response = self.client.get(reverse('api_post_comments', args=[draft.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        Comment.objects.create(post=self.post, author=self.user, content='first')
+        etag = self.client.get(self.url).headers['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user, content='second')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(BLOG_COMMENTS_PER_PAGE=2)
+    def test_detail_page_links_api_for_lazy_loading(self):
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.user, content=f'c{i}') for i in range(5)]
+        )
+        response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertContains(response, f'data-api="{self.url}"')
+        self.assertContains(response, 'id="comments-more"')
+        self.assertNotContains(response, '<p>c2</p>')
+
+
+@override_settings(BLOG_COMMENT_QUEUE=True)
+class CommentQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', password='testpass123')
+        self.post = Post.objects.create(title='Viral', content='Body', author=self.user, is_published=True)
+        self.url = reverse('post_detail', args=[self.post.pk])
+        self.client.force_login(self.user)
+
+    def test_comment_is_queued_and_shown_to_author(self):
+        response = self.client.post(self.url, {'content': 'в очереди'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(PendingComment.objects.count(), 1)
+        self.assertContains(self.client.get(self.url), 'ожидает публикации')
+        other = Client()
+        other.force_login(User.objects.create_user(username='reader', password='testpass123'))
+        self.assertNotContains(other.get(self.url), 'в очереди')
+
+    def test_flush_writes_batches_with_counts_and_replies(self):
+        parent = Comment.objects.create(post=self.post, author=self.user, content='parent')
+        for i in range(3):
+            self.client.post(self.url, {'content': f'queued {i}'})
+        self.client.post(self.url, {'content': 'queued reply', 'parent': parent.pk})
+        with self.assertLogs('blog.comment_queue', 'INFO'):
+            call_command('process_comment_queue', once=True, batch_size=2, stdout=StringIO())
+        self.assertFalse(PendingComment.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 5)
+        reply = Comment.objects.get(content='queued reply')
+        self.assertEqual(reply.parent, parent)
+        self.assertTrue(reply.path.startswith(parent.path))
+        self.assertFalse(Comment.objects.filter(path='').exists())
+
+    def test_flush_counts_replies_once_per_post(self):
+        parent = Comment.objects.create(post=self.post, author=self.user, content='parent')
+        for i in range(3):
+            self.client.post(self.url, {'content': f'reply {i}', 'parent': parent.pk})
+        self.client.post(self.url, {'content': 'root'})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(comment_queue.flush(), 4)
+        counter_updates = [q for q in queries if 'comment_count' in q['sql'] and q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(counter_updates), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 5)
+        for reply in Comment.objects.filter(parent=parent):
+            self.assertEqual(reply.depth, 1)
+            self.assertEqual(reply.path, parent.path + f'{reply.pk:010d}')
+
+    def test_flush_keeps_depth_limit(self):
+        comment = Comment.objects.create(post=self.post, author=self.user, content='0')
+        with mock.patch('blog.models.MAX_DEPTH', 3):
+            for level in range(1, 3):
+                comment = Comment.objects.create(post=self.post, author=self.user, content=str(level),
+                                                 parent=comment)
+            self.client.post(self.url, {'content': 'too deep', 'parent': comment.pk})
+            comment_queue.flush()
+        reply = Comment.objects.get(content='too deep')
+        self.assertEqual(reply.parent_id, comment.parent_id)
+        self.assertEqual(reply.depth, comment.depth)
+        self.assertEqual(reply.path, comment.path[:-10] + f'{reply.pk:010d}')
+
+    @override_settings(BLOG_COMMENT_QUEUE_MAX_DEPTH=1)
+    def test_backpressure_when_queue_is_full(self):
+        self.client.post(self.url, {'content': 'first'})
+        response = self.client.post(self.url, {'content': 'second'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '60')
+        # Текст не потерян - он остался в форме
+        self.assertContains(response, 'second', status_code=503)
+        self.assertEqual(PendingComment.objects.count(), 1)
+
+    def test_queue_depth_metric(self):
+        self.client.post(self.url, {'content': 'metric'})
+        response = self.client.get(reverse('metrics'))
+        self.assertIn('blog_comment_queue_depth 1.0', response.content.decode())
+
+
+@tasks.task(max_attempts=2, retry_delay=0)
+def _flaky_task(marker):
+    raise RuntimeError(marker)
+
+
+@tasks.task()
+def _recording_task(marker):
+    Post.objects.filter(title=marker).update(content='done')
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tasks', password='testpass123')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        feed_dir = override_settings(BLOG_FEED_DIR=tmpdir)
+        feed_dir.enable()
+        self.addCleanup(feed_dir.disable)
+
+    def _hook_events(self):
+        return list(
+            Task.objects.filter(name=hooks.warm_post_pages.task_name)
+            .order_by('pk').values_list('kwargs__event', flat=True)
+        )
+
+    @override_settings(BLOG_WARM_CACHE=True)
+    def test_publish_lifecycle_enqueues_hooks(self):
+        post = Post.objects.create(title='Draft', content='Body', author=self.user)
+        self.assertEqual(self._hook_events(), [])
+        post.is_published = True
+        post.save()
+        post.title = 'Edited'
+        post.save()
+        post.is_published = False
+        post.save()
+        self.assertEqual(self._hook_events(), ['published', 'updated', 'unpublished'])
+
+    @override_settings(BLOG_PAGE_CACHE=True, BLOG_WARM_CACHE=True)
+    def test_worker_warms_page_cache(self):
+        post = Post.objects.create(title='Warm', content='Body', author=self.user, is_published=True)
+        out = StringIO()
+        call_command('run_tasks', once=True, concurrency=1, stdout=out)
+        self.assertIn('Обработано задач: 2', out.getvalue())
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {Task.DONE})
+        reset_stats()
+        self.client.get(reverse('post_detail', args=[post.pk]))
+        self.assertEqual(page_stats()['hits'], 1)
+
+    @override_settings(BLOG_WARM_CACHE=False)
+    def test_no_warming_without_shared_cache(self):
+        Post.objects.create(title='Local', content='Body', author=self.user, is_published=True)
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), [hooks.update_feeds.task_name])
+
+    def test_failed_task_is_retried_then_failed(self):
+        job = tasks.enqueue(_flaky_task, marker='boom')
+        with self.assertLogs('blog.tasks', 'WARNING'):
+            call_command('run_tasks', once=True, concurrency=1, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+    def test_stale_running_task_is_requeued(self):
+        job = tasks.enqueue(_recording_task, marker='stale')
+        Task.objects.filter(pk=job.pk).update(
+            status=Task.RUNNING, attempts=1, started_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(tasks.requeue_stale(lease=60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Task.QUEUED)
+
+    @override_settings(BLOG_TASKS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        Post.objects.create(title='eager', content='Body', author=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(tasks.enqueue(_recording_task, marker='eager'))
+        self.assertEqual(Post.objects.get(title='eager').content, 'done')
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class BackgroundTaskPoolTests(TestCase):
+    def test_thread_pool_runs_tasks_concurrently(self):
+        """Тест что пул потоков выполняет задачи одновременно и доводит все до конца"""
+        ids = [tasks.enqueue(_recording_task, marker=f'pool {i}').pk for i in range(4)]
+        # Задача ждёт, пока вторая не окажется в работе: при последовательном
+        # выполнении барьер не дождётся второго участника
+        barrier = threading.Barrier(2, timeout=5)
+        lock = threading.Lock()
+        executed = []
+
+        def fake_execute_pooled(task_id):
+            barrier.wait()
+            with lock:
+                executed.append((task_id, threading.current_thread().name))
+            return Task.DONE
+
+        out = StringIO()
+        with mock.patch.object(run_tasks, 'execute_pooled', fake_execute_pooled):
+            call_command('run_tasks', once=True, concurrency=2, pool='thread', stdout=out)
+        self.assertIn('Обработано задач: 4', out.getvalue())
+        self.assertEqual(sorted(task_id for task_id, _ in executed), ids)
+        threads = {name for _, name in executed}
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith('blog-task') for name in threads))
+
+
+@override_settings(BLOG_TASKS_EAGER=False)
+class FeedTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='writer', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(
+            title='Первая', content='Текст статьи', author=self.author, is_published=True
+        )
+        Post.objects.create(title='Чужая', content='Текст', author=self.other, is_published=True)
+        Post.objects.create(title='Черновик', content='Текст', author=self.author)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        feed_dir = override_settings(BLOG_FEED_DIR=tmpdir)
+        feed_dir.enable()
+        self.addCleanup(feed_dir.disable)
+
+    def _run_hooks(self):
+        call_command('run_tasks', once=True, concurrency=1, stdout=StringIO())
+
+    def test_global_feeds(self):
+        rss = self.client.get(reverse('feed', args=['rss']))
+        self.assertEqual(rss['Content-Type'], 'application/rss+xml; charset=utf-8')
+        body = b''.join(rss.streaming_content).decode()
+        self.assertIn('Первая', body)
+        self.assertIn('Чужая', body)
+        self.assertNotIn('Черновик', body)
+        atom = self.client.get(reverse('feed', args=['atom']))
+        self.assertIn('xmlns="http://www.w3.org/2005/Atom"', b''.join(atom.streaming_content).decode())
+        self.assertEqual(self.client.get('/feeds/json/').status_code, 404)
+
+    def test_author_feed(self):
+        response = self.client.get(reverse('author_feed', args=['writer', 'rss']))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('Первая', body)
+        self.assertNotIn('Чужая', body)
+        self.assertEqual(self.client.get(reverse('author_feed', args=['nobody', 'rss'])).status_code, 404)
+
+    def test_no_feed_file_for_author_without_posts(self):
+        lurker = User.objects.create_user(username='lurker', password='testpass123')
+        self.assertEqual(self.client.get(reverse('author_feed', args=['lurker', 'rss'])).status_code, 404)
+        self.assertFalse(feeds.feed_file('rss', lurker.pk).exists())
+
+    def test_unchanged_feed_is_not_modified_without_queries(self):
+        etag = self.client.get(reverse('feed', args=['rss']))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('feed', args=['rss']), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_rebuild_without_changes_keeps_etag(self):
+        etag = self.client.get(reverse('feed', args=['rss']))['ETag']
+        self.assertFalse(feeds.write_feed('rss'))
+        self.assertEqual(self.client.get(reverse('feed', args=['rss']))['ETag'], etag)
+
+    def test_publish_hook_updates_affected_feeds(self):
+        self.client.get(reverse('feed', args=['rss']))
+        self.client.get(reverse('author_feed', args=['other', 'rss']))
+        other_feed = feeds.feed_file('rss', self.other.pk)
+        other_mtime = other_feed.stat().st_mtime_ns
+
+        new = Post.objects.create(title='Новая', content='Текст', author=self.author, is_published=True)
+        self._run_hooks()
+        body = feeds.feed_file('rss').read_text(encoding='utf-8')
+        self.assertIn('Новая', body)
+        self.assertIn('Новая', feeds.feed_file('rss', self.author.pk).read_text(encoding='utf-8'))
+        self.assertEqual(other_feed.stat().st_mtime_ns, other_mtime)
+
+        new.is_published = False
+        new.save()
+        self._run_hooks()
+        self.assertNotIn('Новая', feeds.feed_file('rss').read_text(encoding='utf-8'))
+
 
 class CommentTests(TestCase):
     def setUp(self):
@@ -250,6 +1790,6 @@ class IntegrationTests(TestCase):
         
         # 6. Проверка API
         response = self.client.get(reverse('api_posts'))
-        data = response.json()
+        data = response.json()['results']
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['comment_count'], 1)
@@ -1,13 +1,22 @@
 from django.urls import path
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('posts/', views.post_list, name='post_list'),
     path('post/<int:pk>/', views.post_detail, name='post_detail'),
+    path('post/<int:pk>/comments/<int:comment_pk>/', views.comment_thread, name='comment_thread'),
     path('register/', views.register, name='register'),
     path('my-posts/', views.my_posts, name='my_posts'),
     path('create-post/', views.create_post, name='create_post'),
     path('api/posts/', views.api_posts, name='api_posts'),
+    path('api/posts/<int:pk>/comments/', views.api_post_comments, name='api_post_comments'),
+    path('search/', views.search, name='search'),
+    path('api/search/', views.api_search, name='api_search'),
+    path('api/export/', views.export_posts, name='export_posts'),
+    path('feeds/<str:fmt>/', views.feed, name='feed'),
+    path('feeds/author/<str:username>/<str:fmt>/', views.author_feed, name='author_feed'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
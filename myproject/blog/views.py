@@ -1,38 +1,144 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Substr
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from . import feeds
+from .cache import LISTS_SCOPE, anonymous_page_cache, post_scope
+from .comment_queue import QueueFull, aenqueue, pending_comments
+from .conditional import (
+    api_posts_etag, async_condition, post_comments_etag, post_detail_etag,
+)
+from .export import FORMATS, aiterate, export_chunks
 from .models import Post, Comment
 from .forms import CommentForm
+from .pagination import CommentPage, InvalidCursor, apaginate_by_cursor
+from .search import search_comments, search_posts
 
 
-def home(request):
+# Рендер шаблонов (и ленивые запросы внутри них) выполняется в потоке,
+# чтобы асинхронные view не блокировали цикл событий
+arender = sync_to_async(render)
+
+# Сколько символов содержания грузить для превью карточки (truncatewords:30)
+EXCERPT_LENGTH = 1000
+
+
+def published_post_cards():
+    """
+    Опубликованные статьи для карточек списка: автор через JOIN
+    и только нужные карточке колонки.
+    """
+    return (
+        Post.objects.filter(is_published=True)
+        .select_related('author')
+        .only('id', 'title', 'created_at', 'comment_count', 'author__username')
+        .annotate(excerpt=Substr('content', 1, EXCERPT_LENGTH))
+        .order_by('-created_at', '-id')
+    )
+
+
+@anonymous_page_cache(lambda request: LISTS_SCOPE)
+async def home(request):
     """Главная страница с последними опубликованными статьями"""
-    posts = Post.objects.filter(is_published=True)[:5]
-    return render(request, 'blog/home.html', {'posts': posts})
+    posts = [post async for post in published_post_cards()[:5]]
+    return await arender(request, 'blog/home.html', {'posts': posts})
+
 
+@anonymous_page_cache(lambda request: LISTS_SCOPE)
+async def post_list(request):
+    """Список всех опубликованных статей с постраничной навигацией"""
+    posts = published_post_cards()
+    paginator = Paginator(posts, settings.BLOG_POSTS_PER_PAGE)
+    # Paginator.count - cached_property, заполняем его асинхронно заранее
+    paginator.count = await posts.acount()
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = [post async for post in page_obj.object_list]
+    return await arender(request, 'blog/post_list.html', {
+        'posts': page_obj.object_list,
+        'page_obj': page_obj,
+    })
 
-def post_list(request):
-    """Список всех опубликованных статей"""
-    posts = Post.objects.filter(is_published=True)
-    return render(request, 'blog/post_list.html', {'posts': posts})
 
+@sync_to_async
+def _save_comment(comment):
+    with transaction.atomic():
+        # Вставка и обновление счётчика в одной транзакции
+        comment.save()
+
+
+# Колонки комментария, которые выводит шаблон; автор - через JOIN
+COMMENT_FIELDS = ('id', 'parent_id', 'path', 'depth', 'content', 'created_at', 'author__username')
+
+
+def comment_page(queryset, after):
+    """Страница комментариев в порядке дерева; некорректный курсор - первая страница"""
+    queryset = queryset.select_related('author').only(*COMMENT_FIELDS)
+    try:
+        return CommentPage(queryset, after, settings.BLOG_COMMENTS_PER_PAGE)
+    except InvalidCursor:
+        return CommentPage(queryset, None, settings.BLOG_COMMENTS_PER_PAGE)
+
+
+def _comments_fragment(page):
+    # Каждая страница - свой фрагмент, все сбрасываются вместе с версией статьи
+    return f'post_comments:{page.after}' if page.after else 'post_comments'
+
+
+async def _reply_target(post, comment_id):
+    if not comment_id or not str(comment_id).isdigit():
+        return None
+    return await (
+        post.comments.select_related('author')
+        .only('id', 'post_id', 'parent_id', 'path', 'depth', 'author__username')
+        .filter(pk=comment_id)
+        .afirst()
+    )
+
+
+@anonymous_page_cache(lambda request, pk: post_scope(pk))
+@async_condition(post_detail_etag)
+async def post_detail(request, pk):
+    """Детальная страница статьи с первой страницей комментариев"""
+    post = await aget_object_or_404(Post.objects.select_related('author'), pk=pk, is_published=True)
+    # Страница ленивая: при попадании в кэш фрагментов запроса нет
+    page = comment_page(post.comments.all(), request.GET.get('after'))
+    user = await request.auser()
+    reply_to = None
+    status = 200
 
-def post_detail(request, pk):
-    """Детальная страница статьи с комментариями"""
-    post = get_object_or_404(Post, pk=pk, is_published=True)
-    comments = post.comments.all()
-    
     if request.method == 'POST':
-        if request.user.is_authenticated:
+        if user.is_authenticated:
             form = CommentForm(request.POST)
-            if form.is_valid():
+            reply_to = await _reply_target(post, request.POST.get('parent'))
+            if form.is_valid() and settings.BLOG_COMMENT_QUEUE:
+                try:
+                    await aenqueue(post, user, form.cleaned_data['content'], reply_to)
+                except QueueFull:
+                    # Текст остаётся в форме, клиенту предлагается повторить позже
+                    messages.error(request, 'Сейчас слишком много комментариев, отправьте ещё раз через минуту.')
+                    status = 503
+                else:
+                    messages.success(request, 'Комментарий принят и появится через несколько секунд.')
+                    return redirect('post_detail', pk=post.pk)
+            elif form.is_valid():
                 comment = form.save(commit=False)
                 comment.post = post
-                comment.author = request.user
-                comment.save()
+                comment.author = user
+                comment.parent = reply_to
+                await _save_comment(comment)
                 messages.success(request, 'Комментарий добавлен!')
                 return redirect('post_detail', pk=post.pk)
         else:
@@ -40,14 +146,71 @@ def post_detail(request, pk):
             form = CommentForm()
     else:
         form = CommentForm()
-    
-    return render(request, 'blog/post_detail.html', {
+        if user.is_authenticated:
+            reply_to = await _reply_target(post, request.GET.get('reply'))
+
+    pending = []
+    if settings.BLOG_COMMENT_QUEUE and user.is_authenticated:
+        pending = [comment async for comment in pending_comments(post, user)]
+
+    response = await arender(request, 'blog/post_detail.html', {
         'post': post,
-        'comments': comments,
+        'page': page,
+        'comments_fragment': _comments_fragment(page),
+        'pending_comments': pending,
+        'reply_to': reply_to,
         'form': form
+    }, status=status)
+    if status == 503:
+        response['Retry-After'] = '60'
+    return response
+
+
+@anonymous_page_cache(lambda request, pk, comment_pk: post_scope(pk))
+async def comment_thread(request, pk, comment_pk):
+    """Ветка обсуждения: комментарий и все ответы на него, постранично"""
+    post = await aget_object_or_404(Post.objects.only('id', 'title'), pk=pk, is_published=True)
+    root = await aget_object_or_404(
+        post.comments.only('id', 'post_id', 'path', 'depth'), pk=comment_pk
+    )
+    page = comment_page(Comment.objects.subtree(root), request.GET.get('after'))
+    return await arender(request, 'blog/comment_thread.html', {
+        'post': post,
+        'root': root,
+        'page': page,
+        'depth_offset': -root.depth,
     })
 
 
+# Ограничение длины поискового запроса
+SEARCH_QUERY_MAX_LENGTH = 200
+
+
+def _search(request):
+    query = request.GET.get('q', '').strip()[:SEARCH_QUERY_MAX_LENGTH]
+    if not query:
+        return query, [], []
+    return query, search_posts(query), search_comments(query)
+
+
+def search(request):
+    """Полнотекстовый поиск по статьям и комментариям"""
+    query, posts, comments = _search(request)
+    return render(request, 'blog/search.html', {
+        'query': query,
+        'posts': posts,
+        'comments': comments,
+    })
+
+
+def api_search(request):
+    """API полнотекстового поиска (JSON)"""
+    query, posts, comments = _search(request)
+    for item in posts + comments:
+        item['created_at'] = item['created_at'].isoformat()
+    return JsonResponse({'query': query, 'posts': posts, 'comments': comments})
+
+
 def register(request):
     """Регистрация нового пользователя"""
     if request.method == 'POST':
@@ -95,16 +258,130 @@ def create_post(request):
     return render(request, 'blog/create_post.html')
 
 
-def api_posts(request):
-    """API для получения списка статей (JSON)"""
-    posts = Post.objects.filter(is_published=True)
-    data = []
-    for post in posts:
-        data.append({
-            'id': post.id,
-            'title': post.title,
-            'author': post.author.username,
-            'created_at': post.created_at.isoformat(),
-            'comment_count': post.comments.count()
-        })
-    return JsonResponse(data, safe=False)
+def _serialize_post_row(post):
+    return {
+        'id': post['id'],
+        'title': post['title'],
+        'author': post['author__username'],
+        'created_at': post['created_at'].isoformat(),
+        'comment_count': post['comment_count'],
+    }
+
+
+@async_condition(api_posts_etag)
+async def api_posts(request):
+    """API для получения списка статей (JSON) с курсорной пагинацией"""
+    # Автор подтягивается через JOIN, количество комментариев хранится в самой
+    # статье, поэтому страница строится одним запросом без создания моделей.
+    posts = (
+        Post.objects.filter(is_published=True)
+        .values('id', 'title', 'author__username', 'created_at', 'comment_count')
+        .order_by('-created_at', '-id')
+    )
+
+    if request.GET.get('legacy') == '1':
+        # Старый формат: весь список одним массивом
+        data = [_serialize_post_row(post) async for post in posts.aiterator()]
+        return JsonResponse(data, safe=False)
+
+    try:
+        page_size = int(request.GET.get('page_size', settings.BLOG_API_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный page_size'}, status=400)
+    page_size = max(1, min(page_size, settings.BLOG_API_MAX_PAGE_SIZE))
+
+    try:
+        rows, next_cursor, previous_cursor = await apaginate_by_cursor(
+            posts, request.GET.get('cursor'), page_size
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    return JsonResponse({
+        'results': [_serialize_post_row(post) for post in rows],
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
+
+
+def _serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+        'author': comment.author.username,
+        'content': comment.content,
+        'created_at': comment.created_at.isoformat(),
+    }
+
+
+@async_condition(post_comments_etag)
+async def api_post_comments(request, pk):
+    """API комментариев статьи (JSON) в порядке дерева с курсорной пагинацией"""
+    try:
+        page_size = int(request.GET.get('page_size', settings.BLOG_COMMENTS_PER_PAGE))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный page_size'}, status=400)
+    page_size = max(1, min(page_size, settings.BLOG_API_MAX_PAGE_SIZE))
+
+    # Видимость статьи проверяется JOIN-ом в том же запросе, что и страница
+    comments = (
+        Comment.objects.filter(post_id=pk, post__is_published=True)
+        .select_related('author')
+        .only(*COMMENT_FIELDS)
+    )
+    try:
+        page = await CommentPage(comments, request.GET.get('after'), page_size).aload()
+    except InvalidCursor:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+    if not page.comments and not await Post.objects.filter(pk=pk, is_published=True).aexists():
+        return JsonResponse({'error': 'Статья не найдена'}, status=404)
+
+    return JsonResponse({
+        'results': [_serialize_comment(comment) for comment in page.comments],
+        'next': page.next_cursor,
+    })
+
+
+@staff_member_required
+def export_posts(request):
+    """Потоковая выгрузка всех статей с комментариями (NDJSON или JSON-массив)"""
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return JsonResponse({'error': 'Формат должен быть ndjson или json'}, status=400)
+    chunks = export_chunks(fmt, published_only=request.GET.get('published') == '1')
+    if isinstance(request, ASGIRequest):
+        chunks = aiterate(chunks)
+    response = StreamingHttpResponse(chunks, content_type=f'{FORMATS[fmt]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="blog-export.{fmt}"'
+    return response
+
+
+def _serve_feed(request, fmt, author=None):
+    """Готовый файл ленты; ETag и Last-Modified из stat(), без обращения к БД"""
+    if fmt not in feeds.FORMATS:
+        raise Http404
+    path, stat = feeds.feed_stat(fmt, author)
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(path.open('rb'), content_type=feeds.FORMATS[fmt][1])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+def feed(request, fmt):
+    return _serve_feed(request, fmt)
+
+
+def author_feed(request, username, fmt):
+    # Лента - файл на диске: без опубликованных статей её не заводим, иначе
+    # каждый зарегистрировавшийся мог бы создавать файлы
+    authors = User.objects.only('id', 'username').filter(
+        Exists(Post.objects.filter(author=OuterRef('pk'), is_published=True))
+    )
+    author = get_object_or_404(authors, username=username)
+    return _serve_feed(request, fmt, author)
@@ -0,0 +1,38 @@
+"""
+Настройки gunicorn, управляемые переменными окружения.
+
+По умолчанию - ASGI под uvicorn-воркерами: view чтения асинхронные и под
+синхронными воркерами платили бы лишний переход async_to_sync. В ASGI-режиме
+постоянные соединения Django не переиспользуются между запросами, поэтому
+настройки по умолчанию берут соединения из пула: DB_POOL=1, DB_CONN_MAX_AGE=0.
+Синхронные воркеры (с постоянными соединениями вместо пула):
+
+    GUNICORN_APP=myproject.wsgi:application
+    GUNICORN_WORKER_CLASS=sync
+    DB_POOL=0 DB_CONN_MAX_AGE=60
+
+Метрики воркеров prometheus_client пишет в PROMETHEUS_MULTIPROC_DIR, и
+/metrics агрегирует их по всем процессам. Каталог очищается при старте
+мастера, файлы умерших воркеров - при их завершении.
+"""
+import os
+import shutil
+
+wsgi_app = os.getenv("GUNICORN_APP", "myproject.asgi:application")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+prometheus_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/blog-prometheus")
+
+
+def on_starting(server):
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
 
 application = get_asgi_application()
+
+# Шаблоны компилируются до первого запроса (если включён BLOG_TEMPLATE_PRECOMPILE)
+from blog.template_loaders import precompile_templates  # noqa: E402
+
+precompile_templates()
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,7 +45,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Метрики Prometheus (/metrics) - первой, чтобы мерить всю обработку
+    "blog.metrics.PrometheusMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Server-Timing и лог медленных запросов; выключена при BLOG_PROFILING_SAMPLE_RATE=0
+    "blog.profiling.RequestProfilingMiddleware",
+    # Выбор реплики для чтения; выключена, если реплик нет
+    "blog.routers.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -68,6 +77,20 @@ TEMPLATES = [
     },
 ]
 
+# В продакшене шаблоны компилируются при старте воркера (wsgi.py/asgi.py) и
+# держатся в кэширующем загрузчике blog.template_loaders.Loader, который
+# заранее связывает {% extends %} с родителем. При DEBUG=1 остаются
+# стандартные загрузчики, перечитывающие изменённые шаблоны.
+BLOG_TEMPLATE_PRECOMPILE = os.getenv("BLOG_TEMPLATE_PRECOMPILE", "0" if DEBUG else "1") == "1"
+if BLOG_TEMPLATE_PRECOMPILE:
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        ("blog.template_loaders.Loader", [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ]),
+    ]
+
 WSGI_APPLICATION = "myproject.wsgi.application"
 
 
@@ -83,16 +106,112 @@ if os.getenv("DB_ENGINE"):
             "PASSWORD": os.getenv("DB_PASSWORD", "mypassword"),
             "HOST": os.getenv("DB_HOST", "localhost"),
             "PORT": int(os.getenv("DB_PORT", "5432")),
+            # По умолчанию, как и образ (ASGI, uvicorn-воркеры), - пул без постоянных
+            # соединений: в ASGI синхронный ORM выполняется в разных потоках, и каждый
+            # держал бы своё соединение. Для синхронных воркеров: DB_POOL=0, DB_CONN_MAX_AGE=60
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "0")),
+            "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "1") == "1",
         }
     }
+    if os.getenv("DB_POOL", "1") == "1":
+        # Пул psycopg_pool (нужен psycopg 3) несовместим с CONN_MAX_AGE
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            }
+        }
+    # Реплики только для чтения: DB_REPLICA_HOSTS=replica1[:port],replica2[:port]
+    for index, address in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1):
+        host, _, port = address.strip().partition(":")
+        DATABASES[f"replica{index}"] = {
+            **copy.deepcopy(DATABASES["default"]),
+            "HOST": host,
+            "PORT": int(port or DATABASES["default"]["PORT"]),
+            "TEST": {"MIRROR": "default"},
+        }
 else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Транзакция сразу берёт блокировку записи: иначе при параллельной
+            # записи (воркер run_tasks с пулом) SQLite отвечает "database is locked",
+            # не дожидаясь освобождения
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
         }
     }
 
+# Чтение в GET-запросах - с реплик, запись и чтение после своей записи - с default
+DATABASE_ROUTERS = ["blog.routers.ReplicaRouter"]
+BLOG_DB_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+BLOG_REPLICA_STICKY_SECONDS = int(os.getenv("BLOG_REPLICA_STICKY_SECONDS", "15"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию кэш в памяти процесса - только для разработки: версии кэша
+# меняются лишь в процессе, обработавшем запись, и остальные воркеры отдают
+# устаревшие фрагменты. docker-compose задаёт общий бэкенд
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://redis:6379/0
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+# Прогрев кэша после публикации (хук warm_post_pages) имеет смысл только
+# с кэшем, общим для воркера задач и веб-воркеров
+BLOG_WARM_CACHE = os.getenv(
+    "BLOG_WARM_CACHE",
+    "0" if CACHES["default"]["BACKEND"].rsplit(".", 1)[-1] in ("LocMemCache", "DummyCache") else "1",
+) == "1"
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# BLOG_SESSION_MODE: db - сессия читается из БД в каждом запросе (по умолчанию);
+# cached_db - чтение из кэша, запись в кэш и БД (нужен общий CACHE_BACKEND);
+# signed_cookies - данные сессии в подписанной, но не зашифрованной cookie,
+# БД не используется. Просроченные сессии из БД удаляет prune_sessions.
+
+BLOG_SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+BLOG_SESSION_MODE = os.getenv("BLOG_SESSION_MODE", "db")
+if BLOG_SESSION_MODE not in BLOG_SESSION_ENGINES:
+    raise ImproperlyConfigured(
+        f"BLOG_SESSION_MODE={BLOG_SESSION_MODE!r}: допустимы {', '.join(BLOG_SESSION_ENGINES)}"
+    )
+SESSION_ENGINE = BLOG_SESSION_ENGINES[BLOG_SESSION_MODE]
+
+# Сообщения только в cookie: FallbackStorage при переполнении пишет их в сессию
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+# Логи приложения blog (профилирование, пул соединений) - в stdout контейнера
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "blog": {
+            "handlers": ["console"],
+            "level": os.getenv("BLOG_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,3 +254,53 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Blog
+
+# Статей на странице списка
+BLOG_POSTS_PER_PAGE = int(os.getenv("BLOG_POSTS_PER_PAGE", "10"))
+
+# Комментариев на странице статьи; следующие подгружаются по курсору
+BLOG_COMMENTS_PER_PAGE = int(os.getenv("BLOG_COMMENTS_PER_PAGE", "50"))
+
+# Отложенная запись комментариев: форма ставит комментарий в очередь (таблица БД),
+# воркер process_comment_queue записывает их пачками. При BLOG_COMMENT_QUEUE_MAX_DEPTH
+# комментариях в очереди новые отклоняются с 503
+BLOG_COMMENT_QUEUE = os.getenv("BLOG_COMMENT_QUEUE", "0") == "1"
+BLOG_COMMENT_QUEUE_MAX_DEPTH = int(os.getenv("BLOG_COMMENT_QUEUE_MAX_DEPTH", "10000"))
+
+# Фоновые задачи (хуки публикации): очередь в БД, воркер run_tasks.
+# BLOG_TASKS_POOL - thread или process; BLOG_TASKS_EAGER=1 выполняет задачи
+# сразу после коммита в том же процессе (разработка без воркера, по умолчанию при DEBUG)
+BLOG_TASKS_EAGER = os.getenv("BLOG_TASKS_EAGER", "1" if DEBUG else "0") == "1"
+BLOG_TASKS_CONCURRENCY = int(os.getenv("BLOG_TASKS_CONCURRENCY", "4"))
+BLOG_TASKS_POOL = os.getenv("BLOG_TASKS_POOL", "thread")
+
+# Время жизни отрендеренных фрагментов статей, секунды
+BLOG_FRAGMENT_CACHE_TIMEOUT = int(os.getenv("BLOG_FRAGMENT_CACHE_TIMEOUT", "3600"))
+
+# Кэш целых страниц для анонимных посетителей (home, post_list, post_detail)
+BLOG_PAGE_CACHE = os.getenv("BLOG_PAGE_CACHE", "0") == "1"
+BLOG_PAGE_CACHE_TIMEOUT = int(os.getenv("BLOG_PAGE_CACHE_TIMEOUT", "300"))
+
+# Конфигурация полнотекстового поиска PostgreSQL (стемминг)
+BLOG_SEARCH_CONFIG = os.getenv("BLOG_SEARCH_CONFIG", "russian")
+
+# Доля профилируемых запросов (0..1): Server-Timing, JSON-лог blog.profiling;
+# запросы дольше BLOG_SLOW_REQUEST_MS логируются с текстом SQL
+BLOG_PROFILING_SAMPLE_RATE = float(os.getenv("BLOG_PROFILING_SAMPLE_RATE", "0"))
+BLOG_SLOW_REQUEST_MS = int(os.getenv("BLOG_SLOW_REQUEST_MS", "500"))
+
+# Куда админка сохраняет загруженные файлы импорта (для продолжения после сбоя)
+BLOG_IMPORT_DIR = os.getenv("BLOG_IMPORT_DIR", str(BASE_DIR / "imports"))
+
+# Размер страницы /api/posts/ по умолчанию и жёсткий максимум для page_size
+BLOG_API_PAGE_SIZE = int(os.getenv("BLOG_API_PAGE_SIZE", "20"))
+BLOG_API_MAX_PAGE_SIZE = int(os.getenv("BLOG_API_MAX_PAGE_SIZE", "100"))
+
+# RSS/Atom: готовые файлы лент (общий каталог для web и tasks-worker),
+# число записей в ленте и адрес сайта для абсолютных ссылок
+BLOG_FEED_DIR = os.getenv("BLOG_FEED_DIR", str(BASE_DIR / "feeds"))
+BLOG_FEED_ITEMS = int(os.getenv("BLOG_FEED_ITEMS", "20"))
+BLOG_SITE_URL = os.getenv("BLOG_SITE_URL", "http://localhost:8000")